@@ -0,0 +1,154 @@
+"""
+Бенчмарк разбора HTML страниц с расписанием
+Проверяет, что парсер находит на страницах дат из bench_corpus/ те же
+изображения, что записаны в expected.json, а в ленте блога - те же даты
+и страницы, что в expected_feed.json, и что разбор всего корпуса не стал
+медленнее сохраненного эталона. При замедлении скрипт завершается с кодом 1.
+    
+    python bench_parser.py            # проверка
+    python bench_parser.py --update   # запись нового эталона
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from parser import extract_blog_entries, extract_schedule_images
+
+# Папка с сохраненными страницами
+CORPUS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_corpus")
+
+# Ожидаемые изображения для каждой страницы даты
+EXPECTED_FILE = os.path.join(CORPUS_FOLDER, "expected.json")
+
+# Ожидаемые даты и ссылки на страницы для страниц ленты блога
+EXPECTED_FEED_FILE = os.path.join(CORPUS_FOLDER, "expected_feed.json")
+
+# Эталонное время разбора
+BASELINE_FILE = os.path.join(CORPUS_FOLDER, "baseline.json")
+
+# Сколько раз разбирать каждую страницу
+ROUNDS = 200
+
+# Во сколько раз разбор всего корпуса может быть медленнее эталона.
+# Сравнивается сумма по страницам: отдельная страница разбирается около
+# миллисекунды, и ее время слишком зависит от случайных задержек
+MAX_SLOWDOWN = 2.0
+
+
+def calibrate() -> float:
+    """
+    Время фиксированной нагрузки на Python (в миллисекундах)
+    
+    Эталон хранит это время вместе с результатами, поэтому на более
+    медленной или быстрой машине пороги масштабируются.
+    
+    Returns:
+        Минимальное время нагрузки
+    """
+    timings = []
+    for _ in range(30):
+        started = time.perf_counter()
+        total = 0
+        for i in range(200_000):
+            total += i % 7
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def measure(extract, html: str) -> float:
+    """
+    Время разбора страницы (в миллисекундах)
+    
+    Берется минимум по всем повторам: задержки от других процессов
+    только увеличивают время, поэтому минимум устойчивее медианы.
+    
+    Args:
+        extract: Функция разбора
+        html: HTML контент страницы
+    
+    Returns:
+        Минимальное время одного разбора
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        extract(html)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def extract_feed(html: str) -> dict:
+    """Разбор ленты блога в формате expected_feed.json"""
+    entries, pages = extract_blog_entries(html)
+    return {'entries': entries, 'pages': {str(number): url for number, url in pages.items()}}
+
+
+def main() -> int:
+    """Проверка корпуса страниц и сравнение с эталоном"""
+    # Логи парсера на каждой итерации искажают замеры
+    logging.disable(logging.CRITICAL)
+    
+    cases = []
+    for path, extract in ((EXPECTED_FILE, extract_schedule_images), (EXPECTED_FEED_FILE, extract_feed)):
+        with open(path, 'r', encoding='utf-8') as f:
+            cases.extend((name, extract, result) for name, result in json.load(f).items())
+    
+    failed = False
+    results = {}
+    # Калибровка до и после замеров: берется меньшее время
+    calibration = calibrate()
+    
+    print("=" * 50)
+    print("Бенчмарк разбора страниц расписания")
+    print("=" * 50)
+    
+    for name, extract, expected in cases:
+        with open(os.path.join(CORPUS_FOLDER, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        
+        found = extract(html)
+        if found != expected:
+            print(f"❌ {name}: найдено {found}, ожидалось {expected}")
+            failed = True
+            continue
+        
+        results[name] = measure(extract, html)
+        print(f"   {name}: {results[name]:.3f} мс")
+    
+    calibration = min(calibration, calibrate())
+    
+    if '--update' in sys.argv:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'calibration_ms': calibration, 'pages_ms': results}, f, indent=2)
+        print(f"✅ Эталон сохранен: {BASELINE_FILE}")
+        return 1 if failed else 0
+    
+    if not os.path.exists(BASELINE_FILE):
+        print("ℹ️  Эталона нет, запустите с --update")
+        return 1 if failed else 0
+    
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    # Поправка на скорость машины относительно той, где записан эталон
+    scale = calibration / baseline['calibration_ms']
+    
+    # Сравниваются только страницы, для которых есть эталон
+    measured = [name for name in results if name in baseline['pages_ms']]
+    elapsed = sum(results[name] for name in measured)
+    limit = sum(baseline['pages_ms'][name] for name in measured) * scale * MAX_SLOWDOWN
+    print()
+    print(f"   Весь корпус: {elapsed:.3f} мс, допустимо не более {limit:.3f} мс")
+    if elapsed > limit:
+        print("❌ Разбор корпуса замедлился")
+        failed = True
+    
+    print()
+    print("❌ Есть ошибки" if failed else "✅ Разбор не замедлился")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,100 @@
-"""
-Главный файл Telegram-бота для рассылки расписания колледжа
-Использует aiogram 3.x
-"""
-
-import asyncio
-import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-
-from config import BOT_TOKEN, CHECK_INTERVAL
-from handlers import register_handlers
-from scheduler import start_schedule_checker
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
-
-async def main():
-    """Основная функция запуска бота"""
-    try:
-        # Инициализация бота и диспетчера
-        bot = Bot(token=BOT_TOKEN)
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
-        
-        # Регистрация обработчиков команд
-        register_handlers(dp)
-        
-        logger.info("Бот запущен")
-        
-        # Запуск фонового процесса проверки расписания
-        asyncio.create_task(start_schedule_checker(bot, CHECK_INTERVAL))
-        
-        # Запуск polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
-        
-    except Exception as e:
-        logger.error(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
-    finally:
-        await bot.session.close()
-
-
-if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Бот остановлен пользователем")
+"""
+Главный файл Telegram-бота для рассылки расписания колледжа
+Использует aiogram 3.x
+"""
+
+import asyncio
+import logging
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import BOT_TOKEN, BOT_MODE, CHECK_INTERVAL, SCHEDULER_ENABLED
+from database import db
+from handlers import register_handlers
+from metrics import start_metrics_server
+from parser import parser
+from scheduler import start_schedule_checker
+from webhook import run_webhook
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bot.log', encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+async def stop_task(task: asyncio.Task):
+    """
+    Отмена фоновой задачи с ожиданием ее завершения
+    
+    Args:
+        task: Фоновая задача
+    """
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка при остановке фоновой задачи: {e}", exc_info=True)
+
+
+async def main():
+    """Основная функция запуска бота"""
+    checker = None
+    metrics_server = None
+    try:
+        # Инициализация бота и диспетчера
+        bot = Bot(token=BOT_TOKEN)
+        storage = MemoryStorage()
+        dp = Dispatcher(storage=storage)
+        
+        # Регистрация обработчиков команд
+        register_handlers(dp)
+        
+        # Общая HTTP-сессия парсера с пулом соединений
+        await parser.start()
+        
+        # Метрики для Prometheus (GET /metrics)
+        metrics_server = await start_metrics_server()
+        
+        logger.info(f"Бот запущен (режим {BOT_MODE})")
+        
+        # Запуск фонового процесса проверки расписания
+        if SCHEDULER_ENABLED:
+            checker = asyncio.create_task(start_schedule_checker(bot, CHECK_INTERVAL))
+        else:
+            logger.info("Планировщик рассылки отключен (SCHEDULER_ENABLED=0)")
+        
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Если раньше бот работал через webhook, polling без его
+            # удаления не получит обновлений
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    
+    except Exception as e:
+        logger.error(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
+    finally:
+        # Планировщик останавливается до закрытия сессий и БД,
+        # которыми он пользуется
+        if checker:
+            await stop_task(checker)
+        if metrics_server:
+            await metrics_server.cleanup()
+        await parser.close()
+        await db.close()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен пользователем")
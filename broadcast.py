@@ -0,0 +1,433 @@
+"""
+Модуль конкурентной рассылки расписания подписчикам
+Несколько отправителей работают параллельно, общий темп ограничивается
+token bucket под глобальный лимит Telegram
+"""
+
+import asyncio
+import logging
+import random
+import time
+from functools import partial
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Protocol, Set, Tuple
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_RATE_LIMIT,
+    BROADCAST_CHAT_INTERVAL, BROADCAST_PROGRESS_INTERVAL,
+    BROADCAST_MIN_RATE, BROADCAST_RATE_DECREASE, BROADCAST_RATE_INCREASE,
+    BROADCAST_MAX_FLOOD_RETRIES, BROADCAST_MAX_RETRIES, BROADCAST_RETRY_BASE_DELAY
+)
+from database import db
+from metrics import (
+    BROADCAST_MESSAGES, BROADCAST_QUEUE_DEPTH, BROADCAST_RATE_GAUGE,
+    BROADCAST_RETRIES, BROADCAST_SEND_SECONDS, count_error
+)
+from media import get_cached_file_id, get_file_hash, send_schedule_photo
+
+logger = logging.getLogger(__name__)
+
+# Размер очереди получателей на одного отправителя
+QUEUE_SIZE_PER_WORKER = 4
+
+# Ошибки, после которых имеет смысл повторить отправку
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)
+
+# Итоговые статусы получателя
+STATUS_SENT = 'sent'
+STATUS_BLOCKED = 'blocked'
+STATUS_FAILED = 'failed'
+
+
+class BroadcastJournal(Protocol):
+    """Получатель итогов отправки (например, задание рассылки в БД)"""
+    
+    async def record(self, user_id: int, status: str):
+        """
+        Запись итогового статуса получателя
+        
+        Args:
+            user_id: ID пользователя Telegram
+            status: STATUS_SENT, STATUS_BLOCKED или STATUS_FAILED
+        """
+
+
+class TokenBucket:
+    """Ограничитель скорости по алгоритму token bucket"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальный запас токенов (по умолчанию 1 - без всплесков,
+                чтобы в любую секунду уходило не больше rate сообщений)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    @property
+    def paused(self) -> bool:
+        """Приостановлена ли выдача токенов"""
+        return time.monotonic() < self._paused_until
+    
+    def _refill(self):
+        """Пополнение запаса токенов за прошедшее время"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def set_rate(self, rate: float):
+        """
+        Изменение скорости пополнения
+        
+        Args:
+            rate: Новая скорость (токенов в секунду)
+        """
+        self._refill()
+        self.rate = rate
+    
+    def pause(self, seconds: float):
+        """
+        Приостановка выдачи токенов всем ожидающим
+        
+        Args:
+            seconds: Длительность паузы
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        """Ожидание и получение одного токена"""
+        async with self._lock:
+            while True:
+                pause_left = self._paused_until - time.monotonic()
+                if pause_left > 0:
+                    await asyncio.sleep(pause_left)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastStats:
+    """Статистика одной рассылки"""
+    
+    def __init__(self, total: int):
+        self.total = total
+        self.success = 0
+        self.errors = 0
+        self.blocked = 0
+        self.queued = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.started_at = time.monotonic()
+    
+    @property
+    def processed(self) -> int:
+        """Количество обработанных получателей"""
+        return self.success + self.errors + self.blocked
+    
+    @property
+    def elapsed(self) -> float:
+        """Время с начала рассылки (в секундах)"""
+        return time.monotonic() - self.started_at
+    
+    @property
+    def throughput(self) -> float:
+        """Средняя скорость отправки (сообщений в секунду)"""
+        elapsed = self.elapsed
+        return self.success / elapsed if elapsed > 0 else 0.0
+
+
+class Broadcaster:
+    """Движок рассылки изображения расписания списку пользователей"""
+    
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate_limit: float = BROADCAST_RATE_LIMIT,
+        chat_interval: float = BROADCAST_CHAT_INTERVAL,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+        on_progress: Optional[Callable[[BroadcastStats], None]] = None
+    ):
+        """
+        Args:
+            bot: Экземпляр бота
+            concurrency: Количество одновременных отправителей
+            rate_limit: Глобальный лимит сообщений в секунду
+            chat_interval: Минимальный интервал между сообщениями в один чат
+            progress_interval: Как часто сообщать о прогрессе (в секундах)
+            on_progress: Дополнительный обработчик прогресса
+        """
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.max_rate = rate_limit
+        self.bucket = TokenBucket(rate_limit)
+        self.chat_interval = chat_interval
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        # Время последней попытки в чат; хранится только для получателей,
+        # которые еще могут вернуться в очередь, поэтому размер не зависит
+        # от числа подписчиков
+        self._last_sent: Dict[int, float] = {}
+        self._upload_lock = asyncio.Lock()
+    
+    async def run(self, batches: AsyncIterable[Iterable[int]], schedule_path: str,
+                  caption: str, total: int = 0, content_hash: Optional[str] = None,
+                  journal: Optional[BroadcastJournal] = None) -> BroadcastStats:
+        """
+        Рассылка изображения всем пользователям из потока порций
+        
+        Порции читаются по мере отправки через ограниченную очередь,
+        поэтому отправка начинается сразу, а в памяти не держится весь
+        список получателей. Изображение загружается в Telegram один раз
+        (первым удачным отправителем), остальным оно отправляется по
+        file_id. Получатели, упершиеся во флуд-контроль или сетевую
+        ошибку, возвращаются в очередь.
+        
+        Args:
+            batches: Асинхронный поток порций ID (например, db.iter_user_batches())
+            schedule_path: Путь к файлу с расписанием
+            caption: Подпись к изображению
+            total: Ожидаемое число получателей (для прогресса)
+            content_hash: Хэш изображения, если уже известен (тогда файл
+                не читается, пока есть действующий file_id)
+            journal: Куда записывать итог по каждому получателю
+        
+        Returns:
+            Статистика рассылки
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * QUEUE_SIZE_PER_WORKER)
+        stats = BroadcastStats(total)
+        if content_hash is None:
+            content_hash = get_file_hash(schedule_path)
+        send = partial(self._deliver, stats=stats, schedule_path=schedule_path,
+                       caption=caption, content_hash=content_hash, journal=journal)
+        
+        reporter = asyncio.create_task(self._report_progress(stats))
+        # Отложенные возвраты в очередь: ссылки держатся, пока задача не завершится
+        requeues: Set[asyncio.Task] = set()
+        # Значения вычисляются только при запросе метрик
+        BROADCAST_QUEUE_DEPTH.set_function(queue.qsize)
+        BROADCAST_RATE_GAUGE.set_function(lambda: self.bucket.rate)
+        workers = [
+            asyncio.create_task(self._worker(queue, send, requeues))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            async for batch in batches:
+                for user_id in batch:
+                    # Элемент очереди: (ID пользователя, повторы при флуде, повторы при ошибках)
+                    await queue.put((user_id, 0, 0))
+                    stats.queued += 1
+            stats.total = max(stats.total, stats.queued)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            for task in requeues:
+                task.cancel()
+            reporter.cancel()
+            BROADCAST_QUEUE_DEPTH.set_function(None)
+            BROADCAST_RATE_GAUGE.set_function(None)
+            # Финальная запись накопленных изменений (удалений и т.п.)
+            await db.write_behind.flush()
+        
+        self._emit_progress(stats)
+        return stats
+    
+    async def _worker(self, queue: asyncio.Queue, send: Callable[..., Awaitable],
+                      requeues: Set[asyncio.Task]):
+        """
+        Отправитель: забирает получателей из очереди и возвращает неудачные попытки
+        
+        Отправитель не завершается из-за ошибки на одном получателе, и
+        task_done() вызывается всегда, иначе run() навсегда зависнет
+        на queue.join().
+        """
+        while True:
+            item = await queue.get()
+            retry = None
+            try:
+                retry = await send(item)
+            except Exception as e:
+                logger.error(f"Ошибка отправителя на пользователе {item[0]}: {e}", exc_info=True)
+            finally:
+                if retry is None:
+                    queue.task_done()
+                else:
+                    next_item, delay = retry
+                    task = asyncio.create_task(self._requeue_later(queue, next_item, delay))
+                    requeues.add(task)
+                    task.add_done_callback(requeues.discard)
+    
+    async def _requeue_later(self, queue: asyncio.Queue, item: Tuple[int, int, int], delay: float):
+        """
+        Возврат получателя в очередь после задержки
+        
+        task_done() для исходного элемента вызывается только после
+        повторной постановки, поэтому queue.join() не завершится раньше времени.
+        """
+        try:
+            await asyncio.sleep(delay)
+            await queue.put(item)
+        finally:
+            queue.task_done()
+    
+    async def _wait_chat_slot(self, user_id: int):
+        """Соблюдение минимального интервала между сообщениями в один чат"""
+        last = self._last_sent.get(user_id)
+        if last is not None:
+            delay = self.chat_interval - (time.monotonic() - last)
+            if delay > 0:
+                await asyncio.sleep(delay)
+    
+    def _on_flood(self, retry_after: float):
+        """Мультипликативное снижение скорости и пауза всей рассылки"""
+        # Одна волна 429 от параллельных отправителей снижает скорость один раз
+        if not self.bucket.paused:
+            new_rate = max(BROADCAST_MIN_RATE, self.bucket.rate * BROADCAST_RATE_DECREASE)
+            self.bucket.set_rate(new_rate)
+            logger.warning(
+                f"Флуд-контроль Telegram: пауза {retry_after} сек, "
+                f"скорость снижена до {new_rate:.1f} сообщ./сек"
+            )
+        self.bucket.pause(retry_after)
+    
+    def _on_success(self):
+        """Аддитивное восстановление скорости после успешной отправки"""
+        rate = self.bucket.rate
+        if rate < self.max_rate:
+            # Прирост на каждое сообщение 1/rate дает +BROADCAST_RATE_INCREASE в секунду
+            self.bucket.set_rate(min(self.max_rate, rate + BROADCAST_RATE_INCREASE / rate))
+    
+    async def _send(self, user_id: int, schedule_path: str, caption: str, content_hash: str):
+        """Отправка фото; пока file_id неизвестен, загрузку выполняет один отправитель"""
+        send = partial(self.bot.send_photo, chat_id=user_id)
+        if await get_cached_file_id(content_hash) is not None:
+            await send_schedule_photo(send, schedule_path, caption, content_hash)
+            return
+        async with self._upload_lock:
+            await send_schedule_photo(send, schedule_path, caption, content_hash)
+    
+    async def _deliver(self, item: Tuple[int, int, int], stats: BroadcastStats, schedule_path: str,
+                       caption: str, content_hash: str, journal: Optional[BroadcastJournal] = None
+                       ) -> Optional[Tuple[Tuple[int, int, int], float]]:
+        """
+        Отправка расписания одному пользователю с учетом лимитов
+        
+        Returns:
+            None, если получатель обработан окончательно, иначе
+            (элемент для повторной постановки, задержка)
+        """
+        user_id = item[0]
+        try:
+            result = await self._attempt(item, stats, schedule_path, caption, content_hash)
+        except Exception as e:
+            # Ошибка вне отправки (ожидание лимитов и т.п.) - получатель
+            # считается необработанным, рассылка продолжается
+            logger.error(f"Сбой при отправке пользователю {user_id}: {e}", exc_info=True)
+            count_error("broadcast", e)
+            stats.errors += 1
+            result = STATUS_FAILED
+        if isinstance(result, str):
+            # Получатель обработан окончательно, темп для его чата больше не нужен
+            self._last_sent.pop(user_id, None)
+            BROADCAST_MESSAGES.labels(result).inc()
+            if journal is not None:
+                await journal.record(user_id, result)
+            return None
+        return result
+    
+    async def _attempt(self, item: Tuple[int, int, int], stats: BroadcastStats, schedule_path: str,
+                       caption: str, content_hash: str):
+        """
+        Одна попытка отправки (см. _deliver)
+        
+        Returns:
+            Итоговый статус получателя или (элемент для повторной постановки, задержка)
+        """
+        user_id, flood_retries, retries = item
+        await self._wait_chat_slot(user_id)
+        await self.bucket.acquire()
+        self._last_sent[user_id] = time.monotonic()
+        
+        try:
+            with BROADCAST_SEND_SECONDS.labels().time():
+                await self._send(user_id, schedule_path, caption, content_hash)
+            stats.success += 1
+            self._on_success()
+            logger.debug(f"Расписание отправлено пользователю {user_id}")
+            return STATUS_SENT
+        
+        except TelegramRetryAfter as e:
+            count_error("broadcast", e)
+            stats.flood_waits += 1
+            self._on_flood(e.retry_after)
+            if flood_retries < BROADCAST_MAX_FLOOD_RETRIES:
+                stats.retries += 1
+                BROADCAST_RETRIES.labels("flood").inc()
+                return (user_id, flood_retries + 1, retries), e.retry_after
+            logger.error(f"Пользователь {user_id} пропущен: превышено число повторов при флуд-контроле")
+            stats.errors += 1
+        
+        except TelegramForbiddenError as e:
+            count_error("broadcast", e)
+            # Пользователь заблокировал бота
+            logger.warning(f"Пользователь {user_id} заблокировал бота, удаляем из БД")
+            db.remove_user_later(user_id)
+            stats.blocked += 1
+            return STATUS_BLOCKED
+        
+        except TelegramBadRequest as e:
+            logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
+            count_error("broadcast", e)
+            stats.errors += 1
+        
+        except TRANSIENT_ERRORS as e:
+            count_error("broadcast", e)
+            if retries < BROADCAST_MAX_RETRIES:
+                # Экспоненциальная задержка со случайным разбросом
+                delay = BROADCAST_RETRY_BASE_DELAY * (2 ** retries) * random.uniform(0.5, 1.5)
+                logger.warning(
+                    f"Временная ошибка при отправке пользователю {user_id}: {e}. "
+                    f"Повтор через {delay:.1f} сек"
+                )
+                stats.retries += 1
+                BROADCAST_RETRIES.labels("network").inc()
+                return (user_id, flood_retries, retries + 1), delay
+            logger.error(f"Не удалось отправить пользователю {user_id} после {retries} повторов: {e}")
+            stats.errors += 1
+        
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при отправке пользователю {user_id}: {e}")
+            count_error("broadcast", e)
+            stats.errors += 1
+        
+        return STATUS_FAILED
+    
+    async def _report_progress(self, stats: BroadcastStats):
+        """Периодический вывод прогресса рассылки"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._emit_progress(stats)
+    
+    def _emit_progress(self, stats: BroadcastStats):
+        """Запись прогресса в лог и передача его обработчику"""
+        logger.info(
+            f"Прогресс рассылки: {stats.processed}/{stats.total}, "
+            f"скорость {stats.throughput:.1f} сообщ./сек (текущий лимит {self.bucket.rate:.1f}), "
+            f"повторов: {stats.retries}"
+        )
+        if self.on_progress:
+            self.on_progress(stats)
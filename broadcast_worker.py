@@ -0,0 +1,62 @@
+"""
+Процесс-отправитель для рассылки несколькими процессами
+Запускается ботом автоматически (BROADCAST_WORKERS > 0), но его можно
+запустить и вручную, чтобы подключить к идущей рассылке еще процесс:
+
+    python broadcast_worker.py <ID_задания> [число_процессов]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from aiogram import Bot
+
+from config import BOT_TOKEN
+from database import db
+from jobs import BroadcastJob, ShardWorker, worker_broadcaster
+
+# Настройка логирования (PID различает процессы в общем логе)
+logging.basicConfig(
+    level=logging.INFO,
+    format=f'%(asctime)s - worker {os.getpid()} - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(job_id: int, workers: int) -> int:
+    """
+    Обработка шардов задания, пока в очереди есть свободные
+    
+    Args:
+        job_id: ID задания рассылки
+        workers: Сколько процессов делят лимит скорости
+    
+    Returns:
+        Код завершения процесса
+    """
+    bot = Bot(token=BOT_TOKEN)
+    try:
+        job = next((job for job in await BroadcastJob.unfinished() if job.job_id == job_id), None)
+        if job is None:
+            logger.info(f"Задание рассылки {job_id} не найдено или уже завершено")
+            return 0
+        
+        processed = await ShardWorker(job, worker_broadcaster(bot, workers)).run()
+        logger.info(f"Обработано шардов: {processed}")
+        return 0
+    except Exception as e:
+        logger.error(f"Критическая ошибка процесса-отправителя: {e}", exc_info=True)
+        return 1
+    finally:
+        await bot.session.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python broadcast_worker.py <ID_задания> [число_процессов]")
+        sys.exit(2)
+    
+    workers = int(sys.argv[2]) if len(sys.argv) >= 3 else 1
+    sys.exit(asyncio.run(run_worker(int(sys.argv[1]), workers)))
@@ -0,0 +1,337 @@
+"""
+Модуль кэширования расписаний по датам
+Два уровня: LRU в памяти (байты изображений) и хранилище изображений
+на диске (см. storage.py). Индекс дат (что и когда найдено на сайте)
+хранится в таблице schedule_index базы данных
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set
+from database import db
+from storage import ImageStore
+from config import (
+    COLLEGE_URL, SCHEDULE_FOLDER, SCHEDULE_CACHE_MEMORY_LIMIT,
+    SCHEDULE_CACHE_TTL, SCHEDULE_CACHE_MISS_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_page_url(date_key: str) -> str:
+    """
+    Адрес страницы блога с расписанием на дату
+    
+    Args:
+        date_key: Дата в формате YYYY-MM-DD
+    
+    Returns:
+        URL вида https://lsxt.my1.ru/blog/YYYY-MM-DD
+    """
+    return f"{COLLEGE_URL}{date_key}"
+
+
+def _read_file(path: str) -> bytes:
+    """Чтение файла целиком (вызывается в отдельном потоке)"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ScheduleImage:
+    """Изображение расписания на конкретную дату"""
+    
+    def __init__(self, date_key: str, image_url: str, content_hash: str, path: str,
+                 fetched_at: float, data: Optional[bytes] = None):
+        """
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            image_url: URL изображения на сайте колледжа
+            content_hash: Хэш содержимого изображения
+            path: Путь к файлу на диске
+            fetched_at: Время последней проверки на сайте (unix time)
+            data: Содержимое изображения, если загружено в память
+        """
+        self.date_key = date_key
+        self.image_url = image_url
+        self.content_hash = content_hash
+        self.path = path
+        self.fetched_at = fetched_at
+        self.data = data
+    
+    @property
+    def is_fresh(self) -> bool:
+        """Не истек ли срок, после которого запись нужно перепроверить"""
+        return time.time() - self.fetched_at < SCHEDULE_CACHE_TTL
+
+
+class MemoryLRU:
+    """LRU-кэш изображений в памяти с ограничением по суммарному размеру"""
+    
+    def __init__(self, max_bytes: int = SCHEDULE_CACHE_MEMORY_LIMIT):
+        """
+        Args:
+            max_bytes: Максимальный суммарный размер изображений в байтах
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, ScheduleImage]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[ScheduleImage]:
+        """
+        Получение изображения с отметкой об использовании
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            Изображение или None
+        """
+        image = self._items.get(key)
+        if image is not None:
+            self._items.move_to_end(key)
+        return image
+    
+    def put(self, image: ScheduleImage):
+        """
+        Добавление изображения с вытеснением давно не использованных
+        
+        Args:
+            image: Изображение с заполненным data
+        """
+        self.pop(image.date_key)
+        size = len(image.data)
+        if size > self.max_bytes:
+            return
+        
+        self._items[image.date_key] = image
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted.data)
+    
+    def pop(self, key: str):
+        """
+        Удаление изображения из памяти
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+        """
+        image = self._items.pop(key, None)
+        if image is not None:
+            self.size -= len(image.data)
+
+
+class ScheduleCache:
+    """Двухуровневый кэш расписаний: память + диск с индексом дат в SQLite"""
+    
+    def __init__(self, folder: str = SCHEDULE_FOLDER):
+        """
+        Args:
+            folder: Папка для файлов расписаний
+        """
+        self.folder = folder
+        # Индекс дат до перехода на SQLite (переносится в БД при запуске)
+        self.legacy_index_file = os.path.join(folder, "cache_index.json")
+        self.store = ImageStore(folder)
+        self.memory = MemoryLRU()
+    
+    async def import_legacy_index(self) -> int:
+        """
+        Перенос индекса дат из cache_index.json в таблицу schedule_index
+        
+        Returns:
+            Количество перенесенных дат
+        """
+        if not os.path.exists(self.legacy_index_file):
+            return 0
+        
+        try:
+            with open(self.legacy_index_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения старого индекса кэша: {e}")
+            return 0
+        
+        imported = 0
+        for key, entry in legacy.items():
+            if await db.get_schedule_entry(key) is None:
+                await db.save_schedule_entry(key, schedule_page_url(key), [entry['image_url']],
+                                             entry['content_hash'], entry['fetched_at'])
+                imported += 1
+        
+        os.remove(self.legacy_index_file)
+        logger.info(f"Индекс кэша перенесен в БД, дат: {imported}")
+        return imported
+    
+    def path_for(self, content_hash: str) -> str:
+        """
+        Путь к файлу изображения по хэшу содержимого
+        
+        Args:
+            content_hash: Хэш содержимого
+        
+        Returns:
+            Путь к файлу
+        """
+        return self.store.path_for(content_hash)
+    
+    async def get(self, key: str) -> Optional[ScheduleImage]:
+        """
+        Поиск расписания на дату: сначала в памяти, затем в индексе в БД
+        
+        Файл с диска здесь не читается: содержимое подгружается в память
+        отдельно через load().
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            Изображение (возможно, устаревшее - см. is_fresh) или None
+        """
+        image = self.memory.get(key)
+        if image is not None:
+            return image
+        
+        entry = await db.get_schedule_entry(key)
+        if not entry or not entry['content_hash']:
+            return None
+        
+        path = self.path_for(entry['content_hash'])
+        if not os.path.exists(path):
+            # Файл удален вручную - запись индекса больше не действительна
+            await db.delete_schedule_entry(key)
+            return None
+        
+        return ScheduleImage(key, entry['image_urls'][0], entry['content_hash'], path,
+                             entry['last_checked'])
+    
+    async def load(self, image: ScheduleImage) -> Optional[ScheduleImage]:
+        """
+        Загрузка содержимого изображения в память (в отдельном потоке)
+        
+        Args:
+            image: Изображение из кэша
+        
+        Returns:
+            То же изображение с заполненным data или None, если файл пропал
+        """
+        await self.store.touch(image.content_hash)
+        if image.data is None:
+            loop = asyncio.get_running_loop()
+            try:
+                image.data = await loop.run_in_executor(None, _read_file, image.path)
+            except OSError as e:
+                logger.error(f"Ошибка чтения файла расписания {image.path}: {e}")
+                await db.delete_schedule_entry(image.date_key)
+                return None
+        self.memory.put(image)
+        return image
+    
+    async def put(self, key: str, image_urls: List[str], content_hash: str) -> ScheduleImage:
+        """
+        Запись расписания на дату в индекс кэша
+        
+        Файл изображения к этому моменту уже должен лежать в хранилище -
+        его туда кладет потоковое скачивание.
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+            image_urls: Изображения расписания на странице даты (первое - основное)
+            content_hash: Хэш содержимого основного изображения
+        
+        Returns:
+            Запись кэша (без содержимого в памяти)
+        """
+        image = ScheduleImage(key, image_urls[0], content_hash, self.path_for(content_hash), time.time())
+        await db.save_schedule_entry(key, schedule_page_url(key), image_urls, content_hash,
+                                     image.fetched_at)
+        await self.store.record(content_hash, image.image_url, key)
+        # Старое изображение на эту дату больше не актуально
+        self.memory.pop(key)
+        return image
+    
+    async def touch(self, image: ScheduleImage):
+        """
+        Отметка об успешной перепроверке записи на сайте
+        
+        Args:
+            image: Изображение из кэша
+        """
+        image.fetched_at = time.time()
+        await db.touch_schedule_entry(image.date_key, image.fetched_at)
+    
+    async def remember_miss(self, key: str):
+        """
+        Запоминание, что расписания на дату пока нет
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+        """
+        await db.save_schedule_entry(key, schedule_page_url(key), [], None, time.time())
+        self.memory.pop(key)
+    
+    async def remember_discovered(self, key: str, image_urls: List[str]):
+        """
+        Запись результата просмотра ленты блога без скачивания изображения
+
+        Изображение скачается при первом запросе даты. Если на дату уже
+        есть скачанное расписание, а в ленте ее нет, запись не трогается.
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+            image_urls: Изображения расписания на дату (пустой список, если их нет)
+        """
+        if not image_urls:
+            if await self.get(key) is None:
+                await self.remember_miss(key)
+            return
+        
+        image = self.memory.get(key)
+        if image is not None and image.image_url != image_urls[0]:
+            self.memory.pop(key)
+        await db.save_discovered_images(key, schedule_page_url(key), image_urls, time.time())
+
+    async def availability(self, key: str, max_age: float) -> Optional[bool]:
+        """
+        Есть ли расписание на дату по данным индекса, без запроса к сайту
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+            max_age: Сколько секунд после проверки доверять записи
+        
+        Returns:
+            True или False по последней проверке, None если дата
+            не проверялась или проверка старше max_age
+        """
+        entry = await db.get_schedule_entry(key)
+        if entry is None or time.time() - entry['last_checked'] >= max_age:
+            return None
+        return bool(entry['image_urls'])
+    
+    async def is_recent_miss(self, key: str) -> bool:
+        """
+        Проверка, искали ли недавно расписание на дату без результата
+        
+        Args:
+            key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            True, если промах был меньше SCHEDULE_CACHE_MISS_TTL секунд назад
+        """
+        return await self.availability(key, SCHEDULE_CACHE_MISS_TTL) is False
+    
+    async def active_hashes(self, since_key: str) -> Set[str]:
+        """
+        Хэши изображений для дат начиная с указанной
+        
+        Args:
+            since_key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            Множество хэшей, которые нельзя удалять из хранилища
+        """
+        return await db.get_schedule_hashes(since_key)
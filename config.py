@@ -1,28 +1,181 @@
-"""
-Конфигурационный файл с настройками бота
-"""
-
-import os
-from dotenv import load_dotenv
-
-# Загрузка переменных окружения из .env файла
-load_dotenv()
-
-# Токен бота (получить у @BotFather)
-BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
-
-# URL сайта колледжа для парсинга
-COLLEGE_URL = "https://lsxt.my1.ru/blog/"
-
-# Интервал проверки обновлений (в секундах)
-# 6 часов = 21600 секунд, 1 день = 86400 секунд
-CHECK_INTERVAL = 21600  # 6 часов
-
-# Путь к файлу базы данных
-DATABASE_PATH = "database.db"
-
-# Путь к папке для сохранения фото расписания
-SCHEDULE_FOLDER = "schedules"
-
-# Создание папки для расписаний, если её нет
-os.makedirs(SCHEDULE_FOLDER, exist_ok=True)
+"""
+Конфигурационный файл с настройками бота
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения из .env файла
+load_dotenv()
+
+# Токен бота (получить у @BotFather)
+BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
+
+# URL сайта колледжа для парсинга
+COLLEGE_URL = "https://lsxt.my1.ru/blog/"
+
+# Интервал проверки обновлений ночью и предел интервала при ошибках
+# сайта (в секундах)
+CHECK_INTERVAL = 3600  # 1 час
+
+# Проверка изменений расписания на сегодня и завтра (в секундах):
+# часто - в часы, когда колледж обычно публикует расписание, реже - днем
+POLL_ACTIVE_INTERVAL = 300
+POLL_IDLE_INTERVAL = 900
+# Часы публикации (по Москве): с POLL_ACTIVE_START_HOUR до POLL_ACTIVE_END_HOUR
+POLL_ACTIVE_START_HOUR = 12
+POLL_ACTIVE_END_HOUR = 21
+# Ночные часы (по Москве), когда проверка идет раз в CHECK_INTERVAL
+POLL_NIGHT_START_HOUR = 23
+POLL_NIGHT_END_HOUR = 7
+# Случайный разброс интервала (доля), чтобы запросы не шли строго по часам
+POLL_JITTER = 0.2
+
+# Ежедневная рассылка расписания на завтра (час по Москве)
+SCHEDULE_SEND_HOUR = 18
+# За сколько минут до рассылки начинать заранее искать расписание
+PREFETCH_WINDOW_MINUTES = 120
+# Границы интервала опроса сайта во время предзагрузки (в секундах):
+# чем ближе время рассылки, тем чаще проверка
+PREFETCH_MIN_INTERVAL = 60
+PREFETCH_MAX_INTERVAL = 600
+# Чат, куда изображение загружается заранее, чтобы получить file_id
+# до начала рассылки (например, личный чат администратора с ботом).
+# Если не задан, изображение загружается при отправке первому подписчику
+STAGING_CHAT_ID = int(os.getenv("STAGING_CHAT_ID")) if os.getenv("STAGING_CHAT_ID") else None
+
+# Способ получения обновлений от Telegram: "polling" (по умолчанию)
+# или "webhook" - встроенный aiohttp сервер принимает обновления
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес бота для webhook (на Render задается автоматически).
+# Если пуст, сервер принимает обновления, но webhook в Telegram не
+# регистрируется (локальная проверка через send_updates.py)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+# (1-256 символов A-Z, a-z, 0-9, _ и -). Если не задан, выводится из токена
+# бота, чтобы не меняться между перезапусками
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Адрес и порт встроенного сервера (PORT задает хостинг)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+# Сколько обновлений обрабатывать одновременно
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+# Очередь принятых обновлений: когда она заполнена, сервер отвечает
+# Telegram только после освобождения места
+WEBHOOK_QUEUE_SIZE = 1000
+# Сколько секунд при остановке ждать обработки уже принятых обновлений
+WEBHOOK_DRAIN_TIMEOUT = 10
+# Запускать ли планировщик рассылки в этом процессе (0 - например, при
+# локальной проверке webhook через send_updates.py, чтобы не рассылать)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+
+# Метрики в формате Prometheus (GET /metrics). По умолчанию сервер
+# доступен только локально; METRICS_PORT=0 отключает его
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Настройки пула HTTP-соединений к сайту колледжа
+# Общий лимит соединений и лимит на один хост
+HTTP_POOL_LIMIT = 20
+HTTP_POOL_LIMIT_PER_HOST = 8
+# Время кэширования DNS (в секундах)
+HTTP_DNS_CACHE_TTL = 300
+# Время удержания неактивного keep-alive соединения (в секундах)
+HTTP_KEEPALIVE_TIMEOUT = 60
+# Таймаут одного HTTP запроса (в секундах)
+HTTP_TIMEOUT = 30
+# Размер куска при потоковом скачивании изображений (в байтах)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Настройки рассылки
+# Количество одновременных отправителей
+BROADCAST_CONCURRENCY = 10
+# Глобальный лимит сообщений в секунду (у Telegram ~30 сообщений/сек)
+BROADCAST_RATE_LIMIT = 25
+# Минимальный интервал между сообщениями в один чат (в секундах)
+BROADCAST_CHAT_INTERVAL = 1.0
+# Интервал вывода прогресса рассылки в лог (в секундах)
+BROADCAST_PROGRESS_INTERVAL = 5
+# Адаптивная скорость (AIMD): при флуд-контроле скорость умножается на
+# BROADCAST_RATE_DECREASE, после успешных отправок растет на
+# BROADCAST_RATE_INCREASE сообщений/сек за каждую секунду
+BROADCAST_MIN_RATE = 1
+BROADCAST_RATE_DECREASE = 0.5
+BROADCAST_RATE_INCREASE = 1.0
+# Повторы при флуд-контроле (TelegramRetryAfter) и сетевых ошибках
+BROADCAST_MAX_FLOOD_RETRIES = 10
+BROADCAST_MAX_RETRIES = 3
+# Базовая задержка перед повтором при сетевой ошибке (в секундах)
+BROADCAST_RETRY_BASE_DELAY = 1.0
+# Число процессов-отправителей (0 - рассылка в процессе бота).
+# Получатели делятся на порции (шарды) в очереди в SQLite, процессы
+# берут их в аренду; общий лимит скорости делится между процессами
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "0"))
+# Число получателей в одном шарде
+BROADCAST_SHARD_SIZE = 1000
+# Срок аренды шарда и задания рассылки (в секундах): если процесс упал
+# и не продлевает аренду, по истечении срока ее забирает другой процесс
+BROADCAST_LEASE_SECONDS = 60
+
+# Кэш расписаний по датам
+# Лимит изображений в памяти (в байтах)
+SCHEDULE_CACHE_MEMORY_LIMIT = 20 * 1024 * 1024
+# Через сколько секунд запись кэша нужно перепроверить на сайте
+SCHEDULE_CACHE_TTL = 600
+# Сколько секунд помнить, что расписания на дату нет
+SCHEDULE_CACHE_MISS_TTL = 60
+
+# Фоновый прогрев расписаний для выбора даты
+# Сколько ближайших учебных дней держать в кэше
+PREWARM_DAYS = 7
+# Учебные дни недели (0 - понедельник)
+SCHOOL_WEEKDAYS = (0, 1, 2, 3, 4, 5)
+# Сколько дат проверять на сайте одновременно
+PREWARM_CONCURRENCY = 3
+# Интервал прогрева (в секундах); меньше SCHEDULE_CACHE_TTL, чтобы
+# прогретые записи не успевали устареть
+PREWARM_INTERVAL = SCHEDULE_CACHE_TTL - 60
+# Сколько дней вперед (включая сегодня) предлагать при выборе даты
+DATE_PICKER_DAYS = 31
+# Сколько страниц ленты блога (COLLEGE_URL) просматривать при поиске
+# расписаний на период; если лента не дошла до начала периода, даты
+# проверяются по отдельности
+DISCOVERY_MAX_PAGES = 5
+
+# Сравнение изображений по содержимому (нужен Pillow): изображения
+# уменьшаются до SCHEDULE_DIFF_SIZE x SCHEDULE_DIFF_SIZE пикселей в оттенках
+# серого и считаются одинаковыми, если яркость ни одного пикселя
+# не отличается больше чем на SCHEDULE_DIFF_THRESHOLD (из 255)
+SCHEDULE_DIFF_SIZE = 128
+SCHEDULE_DIFF_THRESHOLD = 16
+
+# Хранилище изображений расписания
+# Максимальный суммарный размер файлов (в байтах)
+IMAGE_STORE_MAX_BYTES = 200 * 1024 * 1024
+# Сколько дней хранить изображение после последнего обращения
+IMAGE_STORE_MAX_AGE_DAYS = 30
+# Как часто удалять старые изображения после загрузок (в секундах);
+# при превышении лимита размера удаление идет сразу
+IMAGE_STORE_EVICT_INTERVAL = 3600
+
+# Путь к файлу базы данных
+DATABASE_PATH = "database.db"
+
+# Размер порции при потоковом чтении подписчиков
+USERS_BATCH_SIZE = 1000
+
+# Отложенная запись изменений в БД во время рассылки:
+# запись пачкой при накоплении операций или по таймеру (в секундах)
+WRITE_BEHIND_MAX_SIZE = 500
+WRITE_BEHIND_FLUSH_INTERVAL = 2.0
+
+# Начиная с этого числа подписчиков индекс подписки в памяти хранится
+# компактно (отсортированный массив) вместо множества
+MEMBERSHIP_COMPACT_THRESHOLD = 100_000
+
+# Путь к папке для сохранения фото расписания
+SCHEDULE_FOLDER = "schedules"
+
+# Создание папки для расписаний, если её нет
+os.makedirs(SCHEDULE_FOLDER, exist_ok=True)
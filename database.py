@@ -1,150 +1,1316 @@
-"""
-Модуль для работы с базой данных SQLite
-Хранит информацию о пользователях бота
-"""
-
-import sqlite3
-import logging
-from typing import List
-from config import DATABASE_PATH
-
-logger = logging.getLogger(__name__)
-
-
-class Database:
-    """Класс для работы с базой данных пользователей"""
-    
-    def __init__(self, db_path: str = DATABASE_PATH):
-        """Инициализация подключения к БД"""
-        self.db_path = db_path
-        self.init_db()
-    
-    def init_db(self):
-        """Создание таблицы пользователей, если её нет"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
-                logger.info("База данных инициализирована")
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при инициализации БД: {e}")
-    
-    def add_user(self, user_id: int, username: str = None, first_name: str = None) -> bool:
-        """
-        Добавление пользователя в базу данных
-        
-        Args:
-            user_id: ID пользователя Telegram
-            username: Username пользователя
-            first_name: Имя пользователя
-            
-        Returns:
-            True если пользователь добавлен, False если уже существует
-        """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
-                    (user_id, username, first_name)
-                )
-                conn.commit()
-                
-                if cursor.rowcount > 0:
-                    logger.info(f"Пользователь {user_id} добавлен в БД")
-                    return True
-                else:
-                    logger.info(f"Пользователь {user_id} уже существует в БД")
-                    return False
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при добавлении пользователя {user_id}: {e}")
-            return False
-    
-    def remove_user(self, user_id: int) -> bool:
-        """
-        Удаление пользователя из базы данных
-        
-        Args:
-            user_id: ID пользователя Telegram
-            
-        Returns:
-            True если пользователь удален, False если не найден
-        """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-                conn.commit()
-                
-                if cursor.rowcount > 0:
-                    logger.info(f"Пользователь {user_id} удален из БД")
-                    return True
-                else:
-                    logger.info(f"Пользователь {user_id} не найден в БД")
-                    return False
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при удалении пользователя {user_id}: {e}")
-            return False
-    
-    def is_subscribed(self, user_id: int) -> bool:
-        """
-        Проверка, подписан ли пользователь
-        
-        Args:
-            user_id: ID пользователя Telegram
-            
-        Returns:
-            True если подписан, False если нет
-        """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-                return cursor.fetchone() is not None
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при проверке подписки {user_id}: {e}")
-            return False
-    
-    def get_all_users(self) -> List[int]:
-        """
-        Получение списка всех подписанных пользователей
-        
-        Returns:
-            Список ID пользователей
-        """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT user_id FROM users")
-                return [row[0] for row in cursor.fetchall()]
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при получении списка пользователей: {e}")
-            return []
-    
-    def get_users_count(self) -> int:
-        """
-        Получение количества подписанных пользователей
-        
-        Returns:
-            Количество пользователей
-        """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM users")
-                return cursor.fetchone()[0]
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка при подсчете пользователей: {e}")
-            return 0
-
-
-# Создание глобального экземпляра базы данных
-db = Database()
+"""
+Модуль для работы с базой данных SQLite
+Хранит информацию о пользователях бота
+
+Все запросы выполняются в одном выделенном потоке через одно постоянное
+соединение (режим WAL), поэтому цикл событий не блокируется
+"""
+
+import asyncio
+import bisect
+import functools
+import json
+import sqlite3
+import logging
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from config import (
+    DATABASE_PATH, USERS_BATCH_SIZE,
+    WRITE_BEHIND_MAX_SIZE, WRITE_BEHIND_FLUSH_INTERVAL,
+    MEMBERSHIP_COMPACT_THRESHOLD
+)
+from metrics import DB_QUERY_SECONDS, WRITE_BEHIND_PENDING, count_error
+
+logger = logging.getLogger(__name__)
+
+# Отложенное удаление пользователя (см. Database.remove_user_later)
+DELETE_USER_SQL = "DELETE FROM users WHERE user_id = ?"
+
+# Настройки соединения: WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не делает fsync на каждый коммит
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def run_in_db_thread(method):
+    """
+    Декоратор: выполняет синхронный метод в потоке базы данных
+    
+    Превращает метод в корутину, которая ждет результат из выделенного
+    потока, не блокируя цикл событий. Длительность вызова (вместе с
+    ожиданием потока) попадает в метрику db_query_seconds.
+    """
+    name = method.__name__
+    
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(method, self, *args, **kwargs)
+            )
+        except Exception as e:
+            count_error("database", e)
+            raise
+        finally:
+            DB_QUERY_SECONDS.labels(name).observe(time.perf_counter() - started)
+    return wrapper
+
+
+class MembershipIndex:
+    """
+    Индекс подписчиков в памяти
+    
+    Отвечает на вопрос "подписан ли пользователь" без обращения к БД.
+    При небольшом числе подписчиков хранится множеством, при большом -
+    отсортированным массивом 64-битных ID (8 байт на пользователя вместо
+    ~60 у множества), поиск в нем выполняется бинарным поиском.
+    """
+    
+    def __init__(self, compact_threshold: int = MEMBERSHIP_COMPACT_THRESHOLD):
+        """
+        Args:
+            compact_threshold: С какого числа подписчиков хранить компактно
+        """
+        self.compact_threshold = compact_threshold
+        self._members: set = set()
+        self._compact: Optional[array] = None
+    
+    @property
+    def is_compact(self) -> bool:
+        """Хранится ли индекс в компактном виде"""
+        return self._compact is not None
+    
+    def load(self, user_ids: Iterable[int]):
+        """
+        Заполнение индекса (заменяет текущее содержимое)
+        
+        Args:
+            user_ids: ID подписчиков в порядке возрастания
+        """
+        compact = array('q', user_ids)
+        if len(compact) >= self.compact_threshold:
+            self._compact = compact
+            self._members = set()
+        else:
+            self._compact = None
+            self._members = set(compact)
+    
+    def add(self, user_id: int):
+        """
+        Добавление подписчика
+        
+        Args:
+            user_id: ID пользователя Telegram
+        """
+        if self._compact is None:
+            self._members.add(user_id)
+            return
+        position = bisect.bisect_left(self._compact, user_id)
+        if position == len(self._compact) or self._compact[position] != user_id:
+            self._compact.insert(position, user_id)
+    
+    def discard(self, user_id: int):
+        """
+        Удаление подписчика (если он есть)
+        
+        Args:
+            user_id: ID пользователя Telegram
+        """
+        if self._compact is None:
+            self._members.discard(user_id)
+            return
+        position = bisect.bisect_left(self._compact, user_id)
+        if position < len(self._compact) and self._compact[position] == user_id:
+            del self._compact[position]
+    
+    def __contains__(self, user_id: int) -> bool:
+        if self._compact is None:
+            return user_id in self._members
+        position = bisect.bisect_left(self._compact, user_id)
+        return position < len(self._compact) and self._compact[position] == user_id
+    
+    def __len__(self) -> int:
+        if self._compact is None:
+            return len(self._members)
+        return len(self._compact)
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи
+    
+    Операции (например, удаление заблокировавших бота) не выполняются
+    сразу, а копятся и записываются одной транзакцией через executemany,
+    когда их набирается max_size или проходит flush_interval секунд.
+    """
+    
+    def __init__(self, database: "Database", max_size: int = WRITE_BEHIND_MAX_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL):
+        """
+        Args:
+            database: База данных, в которую записываются операции
+            max_size: Сколько операций накопить до немедленной записи
+            flush_interval: Максимальная задержка записи (в секундах)
+        """
+        self.database = database
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        # SQL-запрос -> список параметров (порядок запросов сохраняется)
+        self._pending: Dict[str, List[tuple]] = {}
+        self._count = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    @property
+    def pending(self) -> int:
+        """Количество операций, ожидающих записи"""
+        return self._count
+    
+    def add(self, sql: str, params: tuple):
+        """
+        Добавление операции в буфер (не ждет записи)
+        
+        Args:
+            sql: SQL-запрос с параметрами
+            params: Параметры запроса
+        """
+        self._pending.setdefault(sql, []).append(params)
+        self._count += 1
+        
+        if self._count >= self.max_size:
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        """Запись буфера по истечении flush_interval"""
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+    
+    async def flush(self) -> int:
+        """
+        Запись всех накопленных операций одной транзакцией
+        
+        Returns:
+            Количество записанных операций
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        async with self._lock:
+            if not self._count:
+                return 0
+            
+            batches = list(self._pending.items())
+            count = self._count
+            self._pending = {}
+            self._count = 0
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+                self._timer = None
+            
+            try:
+                written = await self.database.execute_batches(batches)
+            except Exception as e:
+                logger.error(f"Ошибка отложенной записи: {e}")
+                written = False
+            
+            if written:
+                logger.info(f"Отложенная запись: выполнено операций {count}")
+                return count
+            self._restore(batches, count)
+            return 0
+    
+    def _restore(self, batches: List[Tuple[str, List[tuple]]], count: int):
+        """
+        Возврат незаписанных операций в буфер для повторной записи
+        
+        Операции встают перед добавленными за время записи, чтобы
+        порядок выполнения не изменился.
+        """
+        pending: Dict[str, List[tuple]] = {sql: list(params) for sql, params in batches}
+        for sql, params in self._pending.items():
+            pending.setdefault(sql, []).extend(params)
+        self._pending = pending
+        self._count += count
+        logger.warning(f"Отложенная запись не удалась, операций будет повторено: {count}")
+        
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    def cancel(self, sql: str, params: tuple) -> bool:
+        """
+        Отмена еще не записанной операции
+        
+        Args:
+            sql: SQL-запрос операции
+            params: Параметры операции
+        
+        Returns:
+            True если операция была в буфере
+        """
+        params_list = self._pending.get(sql)
+        if not params_list or params not in params_list:
+            return False
+        remaining = [p for p in params_list if p != params]
+        self._count -= len(params_list) - len(remaining)
+        if remaining:
+            self._pending[sql] = remaining
+        else:
+            del self._pending[sql]
+        return True
+
+
+class Database:
+    """Класс для работы с базой данных пользователей"""
+    
+    def __init__(self, db_path: str = DATABASE_PATH):
+        """Инициализация подключения к БД"""
+        self.db_path = db_path
+        self._connection: Optional[sqlite3.Connection] = None
+        # Один поток - все обращения к соединению идут последовательно
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+        self._executor.submit(self.init_db).result()
+        # Индекс подписчиков в памяти: проверки подписки без запросов к БД
+        self.members = MembershipIndex()
+        self._executor.submit(self._load_members).result()
+        # Отложенная запись изменений, которые не нужны немедленно
+        self.write_behind = WriteBehindBuffer(self)
+        WRITE_BEHIND_PENDING.set_function(lambda: self.write_behind.pending)
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Получение постоянного соединения (вызывается только в потоке БД)
+        
+        Returns:
+            Открытое соединение с примененными настройками
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            for pragma in PRAGMAS:
+                self._connection.execute(pragma)
+        return self._connection
+    
+    async def close(self):
+        """Запись отложенных операций, закрытие соединения и остановка потока БД"""
+        await self.write_behind.flush()
+        
+        def _close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, _close)
+        self._executor.shutdown(wait=True)
+        logger.info("Соединение с БД закрыто")
+    
+    def init_db(self):
+        """Создание таблиц пользователей, file_id, индекса расписаний и заданий рассылки, если их нет"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY,
+                        username TEXT,
+                        first_name TEXT,
+                        subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS file_ids (
+                        content_hash TEXT PRIMARY KEY,
+                        file_id TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schedule_index (
+                        date TEXT PRIMARY KEY,
+                        page_url TEXT NOT NULL,
+                        image_urls TEXT NOT NULL DEFAULT '[]',
+                        content_hash TEXT,
+                        last_checked REAL NOT NULL,
+                        last_changed REAL
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        content_hash TEXT NOT NULL,
+                        image_path TEXT NOT NULL,
+                        caption TEXT,
+                        status TEXT NOT NULL DEFAULT 'running',
+                        cursor INTEGER,
+                        total INTEGER NOT NULL DEFAULT 0,
+                        sent INTEGER NOT NULL DEFAULT 0,
+                        blocked INTEGER NOT NULL DEFAULT 0,
+                        failed INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP,
+                        owner TEXT,
+                        heartbeat REAL
+                    )
+                """)
+                # Владелец задания появился позже самой таблицы
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(broadcast_jobs)")}
+                for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                    if column not in columns:
+                        cursor.execute(f"ALTER TABLE broadcast_jobs ADD COLUMN {column} {kind}")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                        job_id INTEGER NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        PRIMARY KEY (job_id, user_id)
+                    ) WITHOUT ROWID
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS broadcast_shards (
+                        shard_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_id INTEGER NOT NULL,
+                        after_id INTEGER,
+                        last_id INTEGER,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        lease_owner TEXT,
+                        lease_expires REAL,
+                        attempts INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_broadcast_shards_job "
+                    "ON broadcast_shards (job_id, status)"
+                )
+                conn.commit()
+                logger.info("База данных инициализирована")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при инициализации БД: {e}")
+    
+    def _load_members(self):
+        """Загрузка индекса подписчиков из БД (вызывается в потоке БД)"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute("SELECT user_id FROM users ORDER BY user_id")
+                self.members.load(row[0] for row in cursor)
+            logger.info(
+                f"Индекс подписчиков загружен: {len(self.members)}"
+                f"{' (компактный)' if self.members.is_compact else ''}"
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при загрузке индекса подписчиков: {e}")
+    
+    @run_in_db_thread
+    def reload_members(self):
+        """Перезагрузка индекса подписчиков (после изменений из других процессов)"""
+        self._load_members()
+    
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None) -> bool:
+        """
+        Добавление пользователя в базу данных
+        
+        Args:
+            user_id: ID пользователя Telegram
+            username: Username пользователя
+            first_name: Имя пользователя
+            
+        Returns:
+            True если пользователь добавлен, False если уже существует
+        """
+        # Отложенное удаление этого пользователя не должно выполниться
+        # после повторной подписки
+        await self.write_behind.flush()
+        # Если запись не удалась, удаление осталось в буфере: отменяем его,
+        # строка пользователя при этом еще в таблице
+        restored = self.write_behind.cancel(DELETE_USER_SQL, (user_id,))
+        added = await self._insert_user(user_id, username, first_name)
+        if added or restored:
+            self.members.add(user_id)
+        return added or restored
+    
+    @run_in_db_thread
+    def _insert_user(self, user_id: int, username: str = None, first_name: str = None) -> bool:
+        """Вставка пользователя в таблицу (см. add_user)"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+                    (user_id, username, first_name)
+                )
+                conn.commit()
+                
+                if cursor.rowcount > 0:
+                    logger.info(f"Пользователь {user_id} добавлен в БД")
+                    return True
+                else:
+                    logger.info(f"Пользователь {user_id} уже существует в БД")
+                    return False
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при добавлении пользователя {user_id}: {e}")
+            return False
+    
+    async def remove_user(self, user_id: int) -> bool:
+        """
+        Удаление пользователя из базы данных
+        
+        Args:
+            user_id: ID пользователя Telegram
+            
+        Returns:
+            True если пользователь удален, False если не найден
+        """
+        removed = await self._delete_user(user_id)
+        if removed:
+            self.members.discard(user_id)
+        return removed
+    
+    @run_in_db_thread
+    def _delete_user(self, user_id: int) -> bool:
+        """Удаление пользователя из таблицы (см. remove_user)"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+                conn.commit()
+                
+                if cursor.rowcount > 0:
+                    logger.info(f"Пользователь {user_id} удален из БД")
+                    return True
+                else:
+                    logger.info(f"Пользователь {user_id} не найден в БД")
+                    return False
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении пользователя {user_id}: {e}")
+            return False
+    
+    def remove_user_later(self, user_id: int):
+        """
+        Отложенное удаление пользователя (через буфер записи)
+        
+        Используется в рассылке, чтобы каждый заблокировавший бота
+        пользователь не стоил отдельной транзакции.
+        
+        Args:
+            user_id: ID пользователя Telegram
+        """
+        self.members.discard(user_id)
+        self.write_behind.add(DELETE_USER_SQL, (user_id,))
+    
+    @run_in_db_thread
+    def execute_batches(self, batches: List[Tuple[str, List[tuple]]]) -> bool:
+        """
+        Выполнение пачек однотипных запросов одной транзакцией
+        
+        Args:
+            batches: Список пар (SQL-запрос, список параметров)
+        
+        Returns:
+            True если транзакция выполнена, False при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                for sql, params_list in batches:
+                    conn.executemany(sql, params_list)
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при пакетной записи в БД: {e}")
+            return False
+    
+    async def is_subscribed(self, user_id: int) -> bool:
+        """
+        Проверка, подписан ли пользователь (по индексу в памяти)
+        
+        Args:
+            user_id: ID пользователя Telegram
+            
+        Returns:
+            True если подписан, False если нет
+        """
+        return user_id in self.members
+    
+    @run_in_db_thread
+    def get_all_users(self) -> List[int]:
+        """
+        Получение списка всех подписанных пользователей
+        
+        Returns:
+            Список ID пользователей
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT user_id FROM users")
+                return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении списка пользователей: {e}")
+            return []
+    
+    async def get_users_count(self) -> int:
+        """
+        Получение количества подписанных пользователей (по индексу в памяти)
+        
+        Returns:
+            Количество пользователей
+        """
+        return len(self.members)
+    
+    @run_in_db_thread
+    def get_users_batch(self, after_id: Optional[int] = None, limit: int = USERS_BATCH_SIZE) -> array:
+        """
+        Получение очередной порции пользователей по возрастанию ID
+        
+        Используется keyset-пагинация (WHERE user_id > ?), поэтому каждая
+        порция читается по первичному ключу без OFFSET. Ошибка чтения не
+        глушится: пустой массив означал бы конец списка, и задание рассылки
+        завершилось бы, пропустив остальных получателей.
+        
+        Args:
+            after_id: ID, после которого начинать (None - с начала)
+            limit: Размер порции
+            
+        Returns:
+            Компактный массив ID пользователей (пустой, если больше нет)
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                if after_id is None:
+                    cursor.execute("SELECT user_id FROM users ORDER BY user_id LIMIT ?", (limit,))
+                else:
+                    cursor.execute(
+                        "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                        (after_id, limit)
+                    )
+                return array('q', (row[0] for row in cursor))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении порции пользователей после {after_id}: {e}")
+            raise
+    
+    async def iter_user_batches(self, after_id: Optional[int] = None,
+                                batch_size: int = USERS_BATCH_SIZE) -> AsyncIterator[array]:
+        """
+        Потоковый обход подписчиков порциями фиксированного размера
+        
+        В памяти одновременно находится только одна порция, поэтому
+        расход памяти не зависит от числа подписчиков.
+        
+        Args:
+            after_id: ID, после которого продолжить (для возобновления)
+            batch_size: Размер порции
+            
+        Yields:
+            Массивы ID пользователей
+        """
+        while True:
+            batch = await self.get_users_batch(after_id, batch_size)
+            if not batch:
+                return
+            yield batch
+            after_id = batch[-1]
+    
+    @run_in_db_thread
+    def get_file_id(self, content_hash: str) -> Optional[str]:
+        """
+        Получение file_id Telegram для ранее загруженного изображения
+        
+        Args:
+            content_hash: Хэш содержимого изображения
+            
+        Returns:
+            file_id или None, если изображение еще не загружалось
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT file_id FROM file_ids WHERE content_hash = ?", (content_hash,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении file_id для {content_hash}: {e}")
+            return None
+    
+    @run_in_db_thread
+    def save_file_id(self, content_hash: str, file_id: str) -> bool:
+        """
+        Сохранение file_id Telegram для изображения
+        
+        Args:
+            content_hash: Хэш содержимого изображения
+            file_id: Идентификатор файла на серверах Telegram
+            
+        Returns:
+            True если сохранено, False при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO file_ids (content_hash, file_id) VALUES (?, ?)",
+                    (content_hash, file_id)
+                )
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при сохранении file_id для {content_hash}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def delete_file_id(self, content_hash: str) -> bool:
+        """
+        Удаление недействительного file_id
+        
+        Args:
+            content_hash: Хэш содержимого изображения
+            
+        Returns:
+            True если запись удалена, False если не найдена
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM file_ids WHERE content_hash = ?", (content_hash,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении file_id для {content_hash}: {e}")
+            return False
+
+    @staticmethod
+    def _schedule_entry(row: tuple) -> dict:
+        """Строка индекса расписаний в виде словаря"""
+        return {
+            'date': row[0],
+            'page_url': row[1],
+            'image_urls': json.loads(row[2]),
+            'content_hash': row[3],
+            'file_id': row[4],
+            'last_checked': row[5],
+            'last_changed': row[6]
+        }
+    
+    @run_in_db_thread
+    def get_schedule_entry(self, date_key: str) -> Optional[dict]:
+        """
+        Запись индекса расписаний на дату
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            Словарь с полями date, page_url, image_urls, content_hash,
+            file_id, last_checked, last_changed или None, если дата
+            не проверялась. image_urls пуст, если расписания на дату
+            не было; content_hash равен None, если изображение еще не
+            скачивалось
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT s.date, s.page_url, s.image_urls, s.content_hash, f.file_id, "
+                    "s.last_checked, s.last_changed FROM schedule_index s "
+                    "LEFT JOIN file_ids f ON f.content_hash = s.content_hash WHERE s.date = ?",
+                    (date_key,)
+                )
+                row = cursor.fetchone()
+                return self._schedule_entry(row) if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении расписания на {date_key} из индекса: {e}")
+            return None
+    
+    @run_in_db_thread
+    def get_schedule_entries(self, first_key: str, last_key: str) -> List[dict]:
+        """
+        Записи индекса расписаний за период
+        
+        Args:
+            first_key: Первая дата (YYYY-MM-DD, включительно)
+            last_key: Последняя дата (YYYY-MM-DD, включительно)
+        
+        Returns:
+            Список записей (см. get_schedule_entry) по возрастанию даты
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT s.date, s.page_url, s.image_urls, s.content_hash, f.file_id, "
+                    "s.last_checked, s.last_changed FROM schedule_index s "
+                    "LEFT JOIN file_ids f ON f.content_hash = s.content_hash "
+                    "WHERE s.date BETWEEN ? AND ? ORDER BY s.date",
+                    (first_key, last_key)
+                )
+                return [self._schedule_entry(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении индекса расписаний: {e}")
+            return []
+    
+    @run_in_db_thread
+    def get_published_dates(self, first_key: str, last_key: str) -> List[str]:
+        """
+        Даты периода, на которые расписание уже найдено на сайте
+        
+        Args:
+            first_key: Первая дата (YYYY-MM-DD, включительно)
+            last_key: Последняя дата (YYYY-MM-DD, включительно)
+        
+        Returns:
+            Список дат YYYY-MM-DD по возрастанию
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT date FROM schedule_index "
+                    "WHERE date BETWEEN ? AND ? AND image_urls != '[]' ORDER BY date",
+                    (first_key, last_key)
+                )
+                return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении опубликованных дат: {e}")
+            return []
+    
+    @run_in_db_thread
+    def save_schedule_entry(self, date_key: str, page_url: str, image_urls: List[str],
+                            content_hash: Optional[str], checked_at: float) -> bool:
+        """
+        Сохранение результата проверки даты на сайте
+        
+        Время изменения (last_changed) обновляется, только если сменилось
+        изображение.
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            page_url: Страница, на которой искалось расписание
+            image_urls: Найденные изображения (пустой список, если расписания нет)
+            content_hash: Хэш содержимого изображения или None
+            checked_at: Время проверки (unix time)
+        
+        Returns:
+            True если сохранено, False при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO schedule_index
+                        (date, page_url, image_urls, content_hash, last_checked, last_changed)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (date) DO UPDATE SET
+                        page_url = excluded.page_url,
+                        image_urls = excluded.image_urls,
+                        content_hash = excluded.content_hash,
+                        last_checked = excluded.last_checked,
+                        last_changed = CASE
+                            WHEN schedule_index.content_hash IS excluded.content_hash
+                            THEN schedule_index.last_changed
+                            ELSE excluded.last_changed
+                        END
+                    """,
+                    (date_key, page_url, json.dumps(image_urls), content_hash, checked_at, checked_at)
+                )
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при сохранении расписания на {date_key} в индекс: {e}")
+            return False
+    
+    @run_in_db_thread
+    def save_discovered_images(self, date_key: str, page_url: str, image_urls: List[str],
+                               checked_at: float) -> bool:
+        """
+        Сохранение изображений, найденных в ленте блога, без скачивания
+        
+        Если изображения на дату не изменились, скачанная запись не
+        трогается. Если изменились, хэш сбрасывается до скачивания.
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            page_url: Страница даты
+            image_urls: Найденные изображения (не пустой список)
+            checked_at: Время проверки (unix time)
+        
+        Returns:
+            True если сохранено, False при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO schedule_index
+                        (date, page_url, image_urls, content_hash, last_checked, last_changed)
+                    VALUES (?, ?, ?, NULL, ?, ?)
+                    ON CONFLICT (date) DO UPDATE SET
+                        page_url = excluded.page_url,
+                        image_urls = excluded.image_urls,
+                        content_hash = NULL,
+                        last_checked = excluded.last_checked,
+                        last_changed = CASE
+                            WHEN schedule_index.image_urls = excluded.image_urls
+                            THEN schedule_index.last_changed
+                            ELSE excluded.last_changed
+                        END
+                    WHERE schedule_index.image_urls != excluded.image_urls
+                        OR schedule_index.content_hash IS NULL
+                    """,
+                    (date_key, page_url, json.dumps(image_urls), checked_at, checked_at)
+                )
+                conn.commit()
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при сохранении расписания на {date_key} в индекс: {e}")
+            return False
+    
+    @run_in_db_thread
+    def touch_schedule_entry(self, date_key: str, checked_at: float) -> bool:
+        """
+        Отметка о перепроверке даты без изменений
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            checked_at: Время проверки (unix time)
+        
+        Returns:
+            True если запись обновлена
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE schedule_index SET last_checked = ? WHERE date = ?",
+                    (checked_at, date_key)
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при обновлении индекса расписаний для {date_key}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def delete_schedule_entry(self, date_key: str) -> bool:
+        """
+        Удаление записи индекса расписаний (например, если файл пропал)
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            True если запись удалена
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM schedule_index WHERE date = ?", (date_key,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении расписания на {date_key} из индекса: {e}")
+            return False
+    
+    @run_in_db_thread
+    def get_schedule_hashes(self, since_key: str) -> Set[str]:
+        """
+        Хэши изображений расписаний на даты начиная с указанной
+        
+        Args:
+            since_key: Дата в формате YYYY-MM-DD
+        
+        Returns:
+            Множество хэшей
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT DISTINCT content_hash FROM schedule_index "
+                    "WHERE date >= ? AND content_hash IS NOT NULL",
+                    (since_key,)
+                )
+                return {row[0] for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении хэшей расписаний: {e}")
+            return set()
+    
+    @run_in_db_thread
+    def create_broadcast_job(self, content_hash: str, image_path: str,
+                             caption: str, total: int, owner: Optional[str] = None) -> Optional[int]:
+        """
+        Создание задания рассылки
+        
+        Args:
+            content_hash: Хэш содержимого изображения
+            image_path: Путь к файлу изображения
+            caption: Подпись к изображению
+            total: Число получателей на момент создания
+            owner: Процесс, который сразу начнет выполнять задание
+        
+        Returns:
+            ID задания или None при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO broadcast_jobs (content_hash, image_path, caption, total, owner, heartbeat) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (content_hash, image_path, caption, total, owner, time.time())
+                )
+                return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при создании задания рассылки: {e}")
+            return None
+
+    @run_in_db_thread
+    def claim_broadcast_job(self, job_id: int, owner: str, lease_seconds: float) -> bool:
+        """
+        Захват незавершенного задания процессом или продление захвата
+        
+        Задание можно захватить, если у него нет владельца, владелец - этот
+        же процесс или владелец не отмечался дольше lease_seconds (упал).
+        
+        Args:
+            job_id: ID задания рассылки
+            owner: Идентификатор процесса
+            lease_seconds: Через сколько секунд без отметки владелец считается упавшим
+        
+        Returns:
+            True если задание принадлежит этому процессу
+        """
+        try:
+            with self._get_connection() as conn:
+                now = time.time()
+                cursor = conn.execute(
+                    "UPDATE broadcast_jobs SET owner = ?, heartbeat = ? "
+                    "WHERE job_id = ? AND status = 'running' "
+                    "AND (owner IS NULL OR owner = ? OR heartbeat IS NULL OR heartbeat < ?)",
+                    (owner, now, job_id, owner, now - lease_seconds)
+                )
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при захвате задания рассылки {job_id}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def release_broadcast_job(self, job_id: int, owner: str):
+        """
+        Освобождение задания процессом (например, при остановке бота)
+        
+        Args:
+            job_id: ID задания рассылки
+            owner: Идентификатор процесса
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "UPDATE broadcast_jobs SET owner = NULL WHERE job_id = ? AND owner = ?",
+                    (job_id, owner)
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при освобождении задания рассылки {job_id}: {e}")
+    
+    @run_in_db_thread
+    def get_unfinished_broadcast_jobs(self) -> List[dict]:
+        """
+        Получение незавершенных заданий рассылки (в порядке создания)
+        
+        Returns:
+            Список заданий в виде словарей с полями таблицы broadcast_jobs
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT job_id, content_hash, image_path, caption, cursor, total "
+                    "FROM broadcast_jobs WHERE status = 'running' ORDER BY job_id"
+                )
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении заданий рассылки: {e}")
+            return []
+    
+    @run_in_db_thread
+    def get_processed_recipients(self, job_id: int, first_id: int, last_id: int) -> set:
+        """
+        ID получателей из диапазона, которые уже обработаны в задании
+        
+        Args:
+            job_id: ID задания рассылки
+            first_id: Начало диапазона ID пользователей (включительно)
+            last_id: Конец диапазона ID пользователей (включительно)
+        
+        Returns:
+            Множество ID пользователей
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT user_id FROM broadcast_recipients "
+                    "WHERE job_id = ? AND user_id BETWEEN ? AND ?",
+                    (job_id, first_id, last_id)
+                )
+                return {row[0] for row in cursor}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении получателей задания {job_id}: {e}")
+            return set()
+    
+    @run_in_db_thread
+    def record_broadcast_result(self, job_id: int, user_id: int, status: str,
+                                cursor_id: Optional[int] = None) -> bool:
+        """
+        Запись результата отправки одному получателю
+        
+        Запись выполняется сразу (не через буфер), чтобы после перезапуска
+        доставленным пользователям расписание не отправлялось повторно.
+        
+        Args:
+            job_id: ID задания рассылки
+            user_id: ID пользователя Telegram
+            status: Результат: sent, blocked или failed
+            cursor_id: Новая контрольная точка задания, если она сдвинулась
+        
+        Returns:
+            True если записано, False при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO broadcast_recipients (job_id, user_id, status) "
+                    "VALUES (?, ?, ?)",
+                    (job_id, user_id, status)
+                )
+                if cursor_id is not None:
+                    conn.execute(
+                        "UPDATE broadcast_jobs SET cursor = ? WHERE job_id = ?",
+                        (cursor_id, job_id)
+                    )
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при записи результата рассылки {job_id} для {user_id}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def finish_broadcast_job(self, job_id: int, status: str = 'done') -> Optional[Dict[str, int]]:
+        """
+        Завершение задания рассылки
+        
+        Итоги переносятся в строку задания, а построчные отметки
+        о получателях и шарды удаляются.
+        
+        Args:
+            job_id: ID задания рассылки
+            status: Итоговый статус: done или failed
+        
+        Returns:
+            Число получателей по статусам (sent, blocked, failed) или None при ошибке
+        """
+        try:
+            with self._get_connection() as conn:
+                counts = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM broadcast_recipients "
+                    "WHERE job_id = ? GROUP BY status",
+                    (job_id,)
+                ).fetchall())
+                conn.execute(
+                    "UPDATE broadcast_jobs SET status = ?, sent = ?, blocked = ?, failed = ?, "
+                    "finished_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+                    (status, counts.get('sent', 0), counts.get('blocked', 0),
+                     counts.get('failed', 0), job_id)
+                )
+                conn.execute("DELETE FROM broadcast_recipients WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM broadcast_shards WHERE job_id = ?", (job_id,))
+                return counts
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при завершении задания рассылки {job_id}: {e}")
+            return None
+    
+    
+    @run_in_db_thread
+    def create_broadcast_shards(self, job_id: int, after_id: Optional[int],
+                                shard_size: int) -> int:
+        """
+        Разбиение получателей задания на шарды (если еще не разбиты)
+        
+        Шард - диапазон ID пользователей (after_id, last_id]. У последнего
+        шарда нет верхней границы, чтобы в рассылку попали и те, кто
+        подписался во время нее.
+        
+        Args:
+            job_id: ID задания рассылки
+            after_id: ID, после которого начинать (контрольная точка задания)
+            shard_size: Число получателей в шарде
+        
+        Returns:
+            Количество шардов задания
+        """
+        try:
+            with self._get_connection() as conn:
+                existing = conn.execute(
+                    "SELECT COUNT(*) FROM broadcast_shards WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                if existing:
+                    return existing
+                
+                cursor = conn.execute(
+                    "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id",
+                    (after_id if after_id is not None else -1,)
+                )
+                bounds = [row[0] for index, row in enumerate(cursor, 1) if index % shard_size == 0]
+                shards = []
+                start = after_id
+                for last_id in bounds:
+                    shards.append((job_id, start, last_id))
+                    start = last_id
+                shards.append((job_id, start, None))
+                conn.executemany(
+                    "INSERT INTO broadcast_shards (job_id, after_id, last_id) VALUES (?, ?, ?)",
+                    shards
+                )
+                return len(shards)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при разбиении задания {job_id} на шарды: {e}")
+            return 0
+    
+    @run_in_db_thread
+    def claim_broadcast_shard(self, job_id: int, owner: str, lease_seconds: float) -> Optional[dict]:
+        """
+        Аренда свободного шарда (или шарда с истекшей арендой)
+        
+        Выбор и захват выполняются в одной транзакции с блокировкой на
+        запись, поэтому два процесса не получат один и тот же шард.
+        
+        Args:
+            job_id: ID задания рассылки
+            owner: Идентификатор процесса-арендатора
+            lease_seconds: Срок аренды
+        
+        Returns:
+            Шард (shard_id, after_id, last_id) или None, если свободных нет
+        """
+        try:
+            conn = self._get_connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                row = conn.execute(
+                    "SELECT shard_id, after_id, last_id FROM broadcast_shards "
+                    "WHERE job_id = ? AND (status = 'pending' "
+                    "OR (status = 'leased' AND lease_expires < ?)) "
+                    "ORDER BY shard_id LIMIT 1",
+                    (job_id, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE broadcast_shards SET status = 'leased', lease_owner = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 WHERE shard_id = ?",
+                    (owner, now + lease_seconds, row[0])
+                )
+                return {'shard_id': row[0], 'after_id': row[1], 'last_id': row[2]}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при аренде шарда задания {job_id}: {e}")
+            return None
+    
+    @run_in_db_thread
+    def renew_broadcast_shard(self, shard_id: int, owner: str, lease_seconds: float) -> bool:
+        """
+        Продление аренды шарда
+        
+        Args:
+            shard_id: ID шарда
+            owner: Идентификатор процесса-арендатора
+            lease_seconds: Новый срок аренды от текущего момента
+        
+        Returns:
+            True если аренда продлена, False если шард уже не наш
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(
+                    "UPDATE broadcast_shards SET lease_expires = ? "
+                    "WHERE shard_id = ? AND lease_owner = ? AND status = 'leased'",
+                    (time.time() + lease_seconds, shard_id, owner)
+                )
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при продлении аренды шарда {shard_id}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def complete_broadcast_shard(self, shard_id: int, owner: str) -> bool:
+        """
+        Отметка шарда как обработанного
+        
+        Args:
+            shard_id: ID шарда
+            owner: Идентификатор процесса-арендатора
+        
+        Returns:
+            True если шард отмечен, False если аренда была потеряна
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(
+                    "UPDATE broadcast_shards SET status = 'done', lease_expires = NULL "
+                    "WHERE shard_id = ? AND lease_owner = ?",
+                    (shard_id, owner)
+                )
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при завершении шарда {shard_id}: {e}")
+            return False
+    
+    @run_in_db_thread
+    def release_broadcast_shards(self, job_id: int, owners: Iterable[str] = ()) -> int:
+        """
+        Возврат в очередь шардов с истекшей арендой и шардов завершившихся процессов
+        
+        Живую аренду чужого процесса (например, запущенного вручную
+        broadcast_worker.py) освобождать нельзя - получатели шарда
+        получили бы расписание дважды.
+        
+        Args:
+            job_id: ID задания рассылки
+            owners: Арендаторы, процессы которых точно завершились
+        
+        Returns:
+            Количество необработанных шардов задания
+        """
+        owners = list(owners)
+        placeholders = ", ".join("?" * len(owners))
+        owner_filter = f" OR lease_owner IN ({placeholders})" if owners else ""
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "UPDATE broadcast_shards SET status = 'pending', lease_owner = NULL, "
+                    "lease_expires = NULL WHERE job_id = ? AND status = 'leased' "
+                    f"AND (lease_expires < ?{owner_filter})",
+                    (job_id, time.time(), *owners)
+                )
+                return conn.execute(
+                    "SELECT COUNT(*) FROM broadcast_shards WHERE job_id = ? AND status != 'done'",
+                    (job_id,)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при освобождении шардов задания {job_id}: {e}")
+            return 0
+
+
+# Создание глобального экземпляра базы данных
+db = Database()
@@ -0,0 +1,501 @@
+"""
+Модуль устойчивых заданий рассылки
+Задание хранится в SQLite: строка задания, контрольная точка (ID
+пользователя, до которого все получатели обработаны) и итог по каждому
+получателю. После перезапуска задание продолжается с контрольной точки,
+а уже обработанным пользователям расписание повторно не отправляется
+
+Задание выполняет один процесс-владелец, который периодически отмечается
+в строке задания. Задание живого владельца другой процесс не продолжает
+(иначе получатели получили бы расписание дважды), задание упавшего -
+продолжает после истечения аренды
+
+Задание можно разослать несколькими процессами: получатели делятся на
+шарды в таблице broadcast_shards, процессы broadcast_worker.py берут
+шарды в аренду и продлевают ее, пока работают. Шард упавшего процесса
+по истечении аренды забирает другой процесс
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sys
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+from aiogram import Bot
+
+from broadcast import Broadcaster, BroadcastStats
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_RATE_LIMIT,
+    BROADCAST_WORKERS, BROADCAST_SHARD_SIZE, BROADCAST_LEASE_SECONDS
+)
+from database import db
+from media import get_cached_file_id, get_file_hash
+
+logger = logging.getLogger(__name__)
+
+# Скрипт процесса-отправителя
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "broadcast_worker.py")
+
+
+def process_owner(pid: int) -> str:
+    """Идентификатор владельца задания или арендатора шардов для процесса с указанным PID"""
+    return f"{socket.gethostname()}:{pid}"
+
+
+class BroadcastJob:
+    """Задание рассылки одного изображения всем подписчикам"""
+    
+    def __init__(self, job_id: int, content_hash: str, image_path: str, caption: str,
+                 cursor: Optional[int] = None, total: int = 0):
+        """
+        Args:
+            job_id: ID задания в БД
+            content_hash: Хэш содержимого изображения
+            image_path: Путь к файлу изображения
+            caption: Подпись к изображению
+            cursor: ID пользователя, до которого (включительно) все обработаны
+            total: Число получателей на момент создания
+        """
+        self.job_id = job_id
+        self.content_hash = content_hash
+        self.image_path = image_path
+        self.caption = caption
+        self.cursor = cursor
+        self.total = total
+        self.owner = process_owner(os.getpid())
+        # Выданные порции в порядке ID: [последний ID порции, сколько осталось обработать]
+        self._batches: deque = deque()
+        # Задание перехватил другой процесс (выполнение отменил _keep_owner)
+        self._owner_lost = False
+    
+    @classmethod
+    async def create(cls, image_path: str, caption: str, total: int,
+                     content_hash: Optional[str] = None) -> Optional["BroadcastJob"]:
+        """
+        Создание задания рассылки
+        
+        Если незавершенное задание с тем же изображением уже есть,
+        возвращается оно - повторный запуск продолжает рассылку, а не
+        начинает ее заново. Если это задание прямо сейчас выполняет другой
+        процесс (например, ежедневная рассылка бота), возвращается None.
+        
+        Args:
+            image_path: Путь к файлу изображения
+            caption: Подпись к изображению
+            total: Число получателей
+            content_hash: Хэш изображения, если уже известен
+        
+        Returns:
+            Задание или None, если его не удалось сохранить или его уже
+            выполняет другой процесс
+        """
+        if content_hash is None:
+            content_hash = get_file_hash(image_path)
+        for job in await cls.unfinished():
+            if job.content_hash == content_hash:
+                if not await job.claim():
+                    logger.warning(f"Рассылку этого изображения (задание {job.job_id}) "
+                                   f"уже выполняет другой процесс")
+                    return None
+                logger.info(f"Найдено незавершенное задание рассылки {job.job_id} с этим изображением")
+                return job
+        
+        job_id = await db.create_broadcast_job(content_hash, image_path, caption, total,
+                                               process_owner(os.getpid()))
+        if job_id is None:
+            return None
+        logger.info(f"Создано задание рассылки {job_id} на {total} получателей")
+        return cls(job_id, content_hash, image_path, caption, total=total)
+    
+    @classmethod
+    async def unfinished(cls) -> List["BroadcastJob"]:
+        """
+        Незавершенные задания (прерванные перезапуском)
+        
+        Returns:
+            Список заданий в порядке создания
+        """
+        return [cls(**row) for row in await db.get_unfinished_broadcast_jobs()]
+    
+    async def claim(self, wait: bool = False) -> bool:
+        """
+        Захват задания этим процессом
+
+        Args:
+            wait: Если владелец не отвечает, подождать истечения аренды:
+                упавший владелец за это время не отметится, живой - отметится
+        
+        Returns:
+            True если задание принадлежит этому процессу
+        """
+        if await db.claim_broadcast_job(self.job_id, self.owner, BROADCAST_LEASE_SECONDS):
+            return True
+        if not wait:
+            return False
+        logger.info(f"Задание рассылки {self.job_id} занято, ожидание истечения аренды")
+        await asyncio.sleep(BROADCAST_LEASE_SECONDS)
+        return await db.claim_broadcast_job(self.job_id, self.owner, BROADCAST_LEASE_SECONDS)
+    
+    async def _keep_owner(self, execution: asyncio.Task):
+        """Продление владения заданием; если задание перехвачено, его выполнение прекращается"""
+        while True:
+            await asyncio.sleep(BROADCAST_LEASE_SECONDS / 3)
+            if not await self.claim():
+                logger.warning(f"Задание рассылки {self.job_id} перехватил другой процесс")
+                self._owner_lost = True
+                execution.cancel()
+                return
+
+    async def _can_send(self) -> bool:
+        """Проверка, что изображение задания еще можно отправить (иначе задание отменяется)"""
+        if os.path.exists(self.image_path) or await get_cached_file_id(self.content_hash):
+            return True
+        logger.error(
+            f"Задание рассылки {self.job_id}: нет ни файла {self.image_path}, "
+            f"ни file_id - задание отменено"
+        )
+        await db.finish_broadcast_job(self.job_id, 'failed')
+        return False
+    
+    async def run(self, broadcaster: Broadcaster) -> Optional[BroadcastStats]:
+        """
+        Выполнение (или продолжение) задания
+        
+        Если выполнение прервано, задание остается незавершенным и будет
+        продолжено при следующем запуске.
+        
+        Args:
+            broadcaster: Движок рассылки
+        
+        Returns:
+            Статистика этого запуска или None, если отправлять нечего
+        """
+        if not await self._can_send():
+            return None
+        
+        if self.cursor is not None:
+            logger.info(f"Продолжение задания рассылки {self.job_id} после пользователя {self.cursor}")
+        
+        stats = await broadcaster.run(
+            self._recipient_batches(), self.image_path, self.caption, self.total,
+            content_hash=self.content_hash, journal=self
+        )
+        await db.finish_broadcast_job(self.job_id)
+        logger.info(f"Задание рассылки {self.job_id} завершено")
+        return stats
+    
+    async def _recipient_batches(self) -> AsyncIterator[List[int]]:
+        """
+        Порции получателей начиная с контрольной точки
+        
+        Из каждой порции исключаются пользователи, уже обработанные
+        в этом задании до перезапуска.
+        
+        Yields:
+            Списки ID пользователей
+        """
+        async for batch in db.iter_user_batches(after_id=self.cursor):
+            done = await db.get_processed_recipients(self.job_id, batch[0], batch[-1])
+            pending = [user_id for user_id in batch if user_id not in done]
+            self._batches.append([batch[-1], len(pending)])
+            if not pending:
+                # Порция целиком обработана до перезапуска
+                self._advance_cursor()
+                continue
+            yield pending
+    
+    async def record(self, user_id: int, status: str):
+        """
+        Запись итога по получателю и сдвиг контрольной точки
+        
+        Args:
+            user_id: ID пользователя Telegram
+            status: Итоговый статус получателя
+        """
+        for batch in self._batches:
+            if user_id <= batch[0]:
+                batch[1] -= 1
+                break
+        self._advance_cursor()
+        await db.record_broadcast_result(self.job_id, user_id, status, self.cursor)
+    
+    def _advance_cursor(self):
+        """Снятие полностью обработанных порций из начала очереди со сдвигом контрольной точки"""
+        while self._batches and self._batches[0][1] <= 0:
+            self.cursor = self._batches.popleft()[0]
+    
+    async def run_sharded(self, bot: Bot, workers: int) -> Optional[BroadcastStats]:
+        """
+        Выполнение задания несколькими процессами-отправителями
+        
+        Получатели делятся на шарды, затем запускаются процессы
+        broadcast_worker.py. Если какие-то процессы упали, оставшиеся
+        шарды дорабатываются в текущем процессе. Шарды, которые держат
+        процессы, запущенные вручную, не отбираются: задание ждет, пока
+        они будут обработаны или их аренда истечет.
+        
+        Args:
+            bot: Экземпляр бота (для доработки оставшихся шардов)
+            workers: Число процессов
+        
+        Returns:
+            Итоговая статистика задания или None, если отправлять нечего
+        """
+        if not await self._can_send():
+            return None
+        
+        stats = BroadcastStats(self.total)
+        shards = await db.create_broadcast_shards(self.job_id, self.cursor, BROADCAST_SHARD_SIZE)
+        if not shards:
+            return None
+        logger.info(f"Задание рассылки {self.job_id}: {shards} шардов, процессов: {workers}")
+        
+        processes = []
+        try:
+            for _ in range(workers):
+                processes.append(await asyncio.create_subprocess_exec(
+                    sys.executable, WORKER_SCRIPT, str(self.job_id), str(workers)
+                ))
+            codes = await asyncio.gather(*(process.wait() for process in processes))
+        finally:
+            for process in processes:
+                if process.returncode is None:
+                    process.terminate()
+        
+        failed = sum(1 for code in codes if code != 0)
+        # Аренду запущенных здесь процессов можно вернуть сразу - они завершились
+        owners = [process_owner(process.pid) for process in processes]
+        remaining = await db.release_broadcast_shards(self.job_id, owners)
+        if remaining:
+            logger.warning(
+                f"Задание рассылки {self.job_id}: процессов с ошибкой {failed}, "
+                f"дорабатываем оставшиеся шарды ({remaining}) в текущем процессе"
+            )
+            worker = ShardWorker(self, Broadcaster(bot))
+            while True:
+                await worker.run()
+                remaining = await db.release_broadcast_shards(self.job_id)
+                if not remaining:
+                    break
+                # Остальные шарды держат другие живые процессы
+                await asyncio.sleep(worker.lease_seconds / 3)
+        
+        # Процессы удаляли заблокировавших бота напрямую в БД
+        await db.reload_members()
+        counts = await db.finish_broadcast_job(self.job_id) or {}
+        logger.info(f"Задание рассылки {self.job_id} завершено")
+        stats.success = counts.get('sent', 0)
+        stats.blocked = counts.get('blocked', 0)
+        stats.errors = counts.get('failed', 0)
+        return stats
+
+
+class ShardWorker:
+    """Отправитель, который арендует шарды задания и рассылает их получателям"""
+    
+    def __init__(self, job: BroadcastJob, broadcaster: Broadcaster,
+                 lease_seconds: float = BROADCAST_LEASE_SECONDS):
+        """
+        Args:
+            job: Задание рассылки
+            broadcaster: Движок рассылки этого процесса
+            lease_seconds: Срок аренды шарда
+        """
+        self.job = job
+        self.broadcaster = broadcaster
+        self.lease_seconds = lease_seconds
+        self.owner = process_owner(os.getpid())
+        # Аренда текущего шарда потеряна (рассылку шарда отменил _keep_lease)
+        self._lease_lost = False
+    
+    async def run(self) -> int:
+        """
+        Обработка шардов, пока в очереди есть свободные
+        
+        Returns:
+            Количество обработанных шардов
+        """
+        processed = 0
+        while True:
+            shard = await db.claim_broadcast_shard(self.job.job_id, self.owner, self.lease_seconds)
+            if shard is None:
+                return processed
+            if await self._run_shard(shard):
+                processed += 1
+    
+    async def _run_shard(self, shard: Dict[str, Optional[int]]) -> bool:
+        """
+        Рассылка одного шарда с продлением аренды
+        
+        Returns:
+            True если шард обработан, False если аренда потеряна
+        """
+        shard_id = shard['shard_id']
+        logger.info(f"Шард {shard_id} задания {self.job.job_id} взят в работу ({self.owner})")
+        delivery = asyncio.create_task(self.broadcaster.run(
+            self._shard_batches(shard), self.job.image_path, self.job.caption,
+            content_hash=self.job.content_hash, journal=self
+        ))
+        self._lease_lost = False
+        lease = asyncio.create_task(self._keep_lease(shard_id, delivery))
+        try:
+            await delivery
+        except asyncio.CancelledError:
+            # Отмена самого отправителя (остановка бота) не глушится:
+            # False возвращается только при потере аренды
+            if not self._lease_lost:
+                raise
+            return False
+        finally:
+            lease.cancel()
+        return await db.complete_broadcast_shard(shard_id, self.owner)
+    
+    async def _keep_lease(self, shard_id: int, delivery: asyncio.Task):
+        """Продление аренды шарда; при потере аренды рассылка шарда прекращается"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await db.renew_broadcast_shard(shard_id, self.owner, self.lease_seconds):
+                logger.warning(f"Аренда шарда {shard_id} потеряна, шард обработает другой процесс")
+                self._lease_lost = True
+                delivery.cancel()
+                return
+    
+    async def _shard_batches(self, shard: Dict[str, Optional[int]]) -> AsyncIterator[List[int]]:
+        """
+        Порции получателей шарда без уже обработанных
+        
+        Yields:
+            Списки ID пользователей
+        """
+        last_id = shard['last_id']
+        async for batch in db.iter_user_batches(after_id=shard['after_id']):
+            done = await db.get_processed_recipients(self.job.job_id, batch[0], batch[-1])
+            pending = [
+                user_id for user_id in batch
+                if (last_id is None or user_id <= last_id) and user_id not in done
+            ]
+            if pending:
+                yield pending
+            if last_id is not None and batch[-1] >= last_id:
+                return
+    
+    async def record(self, user_id: int, status: str):
+        """
+        Запись итога по получателю
+        
+        Args:
+            user_id: ID пользователя Telegram
+            status: Итоговый статус получателя
+        """
+        await db.record_broadcast_result(self.job.job_id, user_id, status)
+
+
+def worker_broadcaster(bot: Bot, workers: int) -> Broadcaster:
+    """
+    Движок рассылки для одного из нескольких процессов
+    
+    Лимиты Telegram действуют на бота целиком, поэтому скорость
+    и число отправителей делятся между процессами.
+    
+    Args:
+        bot: Экземпляр бота
+        workers: Число процессов
+    
+    Returns:
+        Движок рассылки
+    """
+    workers = max(1, workers)
+    return Broadcaster(
+        bot,
+        concurrency=max(1, BROADCAST_CONCURRENCY // workers),
+        rate_limit=BROADCAST_RATE_LIMIT / workers
+    )
+
+
+async def run_job(bot: Bot, job: BroadcastJob, broadcaster: Optional[Broadcaster] = None,
+                  workers: int = BROADCAST_WORKERS) -> Optional[BroadcastStats]:
+    """
+    Выполнение задания в текущем процессе или несколькими процессами
+    
+    Задание должно быть захвачено этим процессом (BroadcastJob.claim);
+    пока оно выполняется, владение продлевается, а после - освобождается.
+    
+    Args:
+        bot: Экземпляр бота
+        job: Задание рассылки
+        broadcaster: Движок рассылки (по умолчанию - с настройками из config)
+        workers: Число процессов-отправителей (0 - в текущем процессе)
+    
+    Returns:
+        Статистика рассылки или None, если отправлять нечего
+    """
+    if workers > 0:
+        execution = asyncio.create_task(job.run_sharded(bot, workers))
+    else:
+        execution = asyncio.create_task(job.run(broadcaster or Broadcaster(bot)))
+    keeper = asyncio.create_task(job._keep_owner(execution))
+    try:
+        return await execution
+    except asyncio.CancelledError:
+        if not job._owner_lost:
+            raise
+        return None
+    finally:
+        keeper.cancel()
+        await db.release_broadcast_job(job.job_id, job.owner)
+
+
+async def broadcast_schedule(bot: Bot, image_path: str, caption: str, total: int,
+                             broadcaster: Optional[Broadcaster] = None,
+                             workers: int = BROADCAST_WORKERS,
+                             content_hash: Optional[str] = None) -> Optional[BroadcastStats]:
+    """
+    Рассылка изображения всем подписчикам через устойчивое задание
+    
+    Args:
+        bot: Экземпляр бота
+        image_path: Путь к файлу изображения
+        caption: Подпись к изображению
+        total: Число получателей
+        broadcaster: Движок рассылки (по умолчанию - с настройками из config)
+        workers: Число процессов-отправителей (0 - в текущем процессе)
+        content_hash: Хэш изображения, если уже известен
+    
+    Returns:
+        Статистика рассылки или None, если задание не удалось создать
+    """
+    job = await BroadcastJob.create(image_path, caption, total, content_hash)
+    if job is None:
+        return None
+    return await run_job(bot, job, broadcaster, workers)
+
+
+async def resume_broadcasts(bot: Bot, broadcaster: Optional[Broadcaster] = None,
+                            workers: int = BROADCAST_WORKERS) -> int:
+    """
+    Продолжение заданий рассылки, прерванных перезапуском
+    
+    Args:
+        bot: Экземпляр бота
+        broadcaster: Движок рассылки (по умолчанию - с настройками из config)
+        workers: Число процессов-отправителей (0 - в текущем процессе)
+    
+    Returns:
+        Количество продолженных заданий
+    """
+    resumed = 0
+    for job in await BroadcastJob.unfinished():
+        if not await job.claim(wait=True):
+            logger.info(f"Задание рассылки {job.job_id} выполняет другой процесс, пропускаем")
+            continue
+        logger.info(f"Возобновление прерванного задания рассылки {job.job_id}")
+        resumed += 1
+        stats = await run_job(bot, job, broadcaster, workers)
+        if stats:
+            logger.info(
+                f"Задание {job.job_id}: успешно {stats.success}, "
+                f"ошибок {stats.errors}, заблокировали {stats.blocked}"
+            )
+    return resumed
@@ -1,52 +1,169 @@
-"""
-Модуль с клавиатурами для бота
-"""
-
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-
-
-def get_main_keyboard(is_subscribed: bool = False) -> ReplyKeyboardMarkup:
-    """
-    Создание главной клавиатуры с кнопками
-    
-    Args:
-        is_subscribed: Подписан ли пользователь
-        
-    Returns:
-        Клавиатура с кнопками
-    """
-    keyboard = [
-        [
-            KeyboardButton(text="✅ Подписаться" if not is_subscribed else "❌ Отписаться")
-        ],
-        [
-            KeyboardButton(text="📅 Расписание на завтра"),
-            KeyboardButton(text="📆 Выбрать дату")
-        ],
-        [
-            KeyboardButton(text="ℹ️ Информация")
-        ]
-    ]
-    
-    return ReplyKeyboardMarkup(
-        keyboard=keyboard,
-        resize_keyboard=True,
-        input_field_placeholder="Выберите действие..."
-    )
-
-
-def get_inline_subscribe_keyboard() -> InlineKeyboardMarkup:
-    """
-    Создание inline клавиатуры для подписки
-    
-    Returns:
-        Inline клавиатура
-    """
-    keyboard = [
-        [
-            InlineKeyboardButton(text="✅ Подписаться", callback_data="subscribe"),
-            InlineKeyboardButton(text="❌ Отписаться", callback_data="unsubscribe")
-        ]
-    ]
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+"""
+Модуль с клавиатурами для бота
+"""
+
+import calendar
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import FrozenSet, List, Tuple
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import DATE_PICKER_DAYS, SCHOOL_WEEKDAYS
+
+# Названия месяцев для заголовка календаря
+MONTHS_RU = {
+    1: 'Январь', 2: 'Февраль', 3: 'Март', 4: 'Апрель',
+    5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
+    9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
+}
+
+# Дни недели
+WEEKDAYS_RU = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+# Отметка даты, на которую расписание уже опубликовано
+PUBLISHED_MARK = "✅"
+
+# Кнопка без действия (пустые клетки, заголовки)
+NOOP_CALLBACK = "calnoop"
+
+# Префикс кнопок перелистывания календаря: calpage_<номер страницы>
+PAGE_CALLBACK_PREFIX = "calpage_"
+
+
+def get_main_keyboard(is_subscribed: bool = False) -> ReplyKeyboardMarkup:
+    """
+    Создание главной клавиатуры с кнопками
+    
+    Args:
+        is_subscribed: Подписан ли пользователь
+    
+    Returns:
+        Клавиатура с кнопками
+    """
+    keyboard = [
+        [
+            KeyboardButton(text="✅ Подписаться" if not is_subscribed else "❌ Отписаться")
+        ],
+        [
+            KeyboardButton(text="📅 Расписание на завтра"),
+            KeyboardButton(text="📆 Выбрать дату")
+        ],
+        [
+            KeyboardButton(text="ℹ️ Информация")
+        ]
+    ]
+    
+    return ReplyKeyboardMarkup(
+        keyboard=keyboard,
+        resize_keyboard=True,
+        input_field_placeholder="Выберите действие..."
+    )
+
+
+def get_inline_subscribe_keyboard() -> InlineKeyboardMarkup:
+    """
+    Создание inline клавиатуры для подписки
+    
+    Returns:
+        Inline клавиатура
+    """
+    keyboard = [
+        [
+            InlineKeyboardButton(text="✅ Подписаться", callback_data="subscribe"),
+            InlineKeyboardButton(text="❌ Отписаться", callback_data="unsubscribe")
+        ]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def date_picker_range(today: date) -> Tuple[date, date]:
+    """
+    Первая и последняя дата, которые можно выбрать
+    
+    Args:
+        today: Текущая дата
+    
+    Returns:
+        Кортеж (сегодня, последняя дата через DATE_PICKER_DAYS дней)
+    """
+    return today, today + timedelta(days=DATE_PICKER_DAYS - 1)
+
+
+def date_picker_months(today: date) -> List[Tuple[int, int]]:
+    """
+    Месяцы, которые показывает календарь (по одному на страницу)
+    
+    Args:
+        today: Текущая дата
+    
+    Returns:
+        Список пар (год, месяц)
+    """
+    first, last = date_picker_range(today)
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+@lru_cache(maxsize=32)
+def get_date_picker_keyboard(today: date, published: FrozenSet[str] = frozenset(),
+                             page: int = 0) -> InlineKeyboardMarkup:
+    """
+    Календарь для выбора даты (одна страница - один месяц)
+    
+    Клавиатура строится один раз на день и набор опубликованных дат,
+    дальше берется из кэша. Столбцы - только учебные дни недели, выбрать
+    можно даты в пределах DATE_PICKER_DAYS дней от сегодня; недели,
+    в которых выбрать нечего, не показываются.
+    
+    Args:
+        today: Текущая дата
+        published: Даты (YYYY-MM-DD), на которые расписание уже опубликовано
+        page: Номер страницы (0 - текущий месяц)
+    
+    Returns:
+        Inline клавиатура
+    """
+    months = date_picker_months(today)
+    page = max(0, min(page, len(months) - 1))
+    year, month = months[page]
+    first, last = date_picker_range(today)
+    
+    empty = InlineKeyboardButton(text=" ", callback_data=NOOP_CALLBACK)
+    keyboard = [
+        [InlineKeyboardButton(text=f"{MONTHS_RU[month]} {year}", callback_data=NOOP_CALLBACK)],
+        [
+            InlineKeyboardButton(text=WEEKDAYS_RU[weekday], callback_data=NOOP_CALLBACK)
+            for weekday in range(7) if weekday in SCHOOL_WEEKDAYS
+        ]
+    ]
+    
+    for week in calendar.Calendar().monthdatescalendar(year, month):
+        row = []
+        for day in week:
+            if day.weekday() not in SCHOOL_WEEKDAYS:
+                continue
+            if day.month != month or not first <= day <= last:
+                row.append(empty)
+                continue
+            mark = PUBLISHED_MARK if day.strftime('%Y-%m-%d') in published else ""
+            row.append(InlineKeyboardButton(
+                text=f"{mark}{day.day}",
+                callback_data=f"date_{day.strftime('%Y%m%d')}"
+            ))
+        if any(button is not empty for button in row):
+            keyboard.append(row)
+    
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"{PAGE_CALLBACK_PREFIX}{page - 1}"))
+    if page < len(months) - 1:
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"{PAGE_CALLBACK_PREFIX}{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
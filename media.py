@@ -0,0 +1,173 @@
+"""
+Модуль для отправки изображений расписания через Telegram
+Изображение загружается на серверы Telegram один раз, дальше
+отправка идет по сохраненному file_id
+"""
+
+import logging
+from functools import partial
+from typing import Awaitable, Callable, Dict, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import BufferedInputFile, FSInputFile, Message
+
+from database import db
+from parser import parser
+
+logger = logging.getLogger(__name__)
+
+# Кэш file_id в памяти: хэш содержимого -> file_id
+_file_ids: Dict[str, str] = {}
+
+
+def get_file_hash(path: str) -> str:
+    """
+    Вычисление хэша содержимого файла изображения
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        Хэш содержимого (тот же, что использует парсер)
+    """
+    with open(path, 'rb') as f:
+        return parser.calculate_hash(f.read())
+
+
+async def get_cached_file_id(content_hash: str) -> Optional[str]:
+    """
+    Получение file_id по хэшу содержимого (сначала из памяти, потом из БД)
+
+    Args:
+        content_hash: Хэш содержимого изображения
+
+    Returns:
+        file_id или None
+    """
+    file_id = _file_ids.get(content_hash)
+    if file_id is None:
+        file_id = await db.get_file_id(content_hash)
+        if file_id:
+            _file_ids[content_hash] = file_id
+    return file_id
+
+
+async def remember_file_id(content_hash: str, message: Message) -> Optional[str]:
+    """
+    Сохранение file_id из отправленного сообщения с фото
+
+    Args:
+        content_hash: Хэш содержимого изображения
+        message: Сообщение, которое вернул Telegram после отправки
+
+    Returns:
+        file_id или None, если в сообщении нет фото
+    """
+    if not message or not message.photo:
+        return None
+
+    # Последний элемент - самый большой размер фото
+    file_id = message.photo[-1].file_id
+    _file_ids[content_hash] = file_id
+    await db.save_file_id(content_hash, file_id)
+    logger.info(f"Сохранен file_id для изображения {content_hash}")
+    return file_id
+
+
+async def forget_file_id(content_hash: str):
+    """
+    Удаление file_id, который Telegram больше не принимает
+
+    Args:
+        content_hash: Хэш содержимого изображения
+    """
+    _file_ids.pop(content_hash, None)
+    await db.delete_file_id(content_hash)
+
+
+async def send_schedule_photo(
+    send: Callable[..., Awaitable[Message]],
+    schedule_path: str,
+    caption: str,
+    content_hash: Optional[str] = None,
+    data: Optional[bytes] = None
+) -> Message:
+    """
+    Отправка изображения расписания с повторным использованием file_id
+
+    Если изображение с таким содержимым уже загружалось, оно отправляется
+    по file_id без повторной загрузки. Иначе файл загружается, а полученный
+    file_id сохраняется для следующих отправок.
+
+    Args:
+        send: Функция отправки фото (например, message.answer_photo
+            или functools.partial(bot.send_photo, chat_id=...))
+        schedule_path: Путь к файлу с расписанием
+        caption: Подпись к изображению
+        content_hash: Хэш содержимого, если уже известен
+        data: Содержимое изображения, если оно уже в памяти (тогда файл
+            с диска не читается)
+
+    Returns:
+        Отправленное сообщение
+    """
+    if content_hash is None:
+        content_hash = parser.calculate_hash(data) if data is not None else get_file_hash(schedule_path)
+
+    file_id = await get_cached_file_id(content_hash)
+    if file_id:
+        try:
+            return await send(photo=file_id, caption=caption)
+        except TelegramBadRequest as e:
+            # file_id мог стать недействительным (например, сменился токен бота)
+            if 'file' not in str(e).lower():
+                raise
+            logger.warning(f"file_id для {content_hash} недействителен, загружаем заново: {e}")
+            await forget_file_id(content_hash)
+
+    if data is not None:
+        photo = BufferedInputFile(data, filename=f"{content_hash}.jpg")
+    else:
+        photo = FSInputFile(schedule_path)
+    message = await send(photo=photo, caption=caption)
+    await remember_file_id(content_hash, message)
+    return message
+
+
+async def prepare_file_id(bot: Bot, chat_id: int, schedule_path: str, content_hash: str,
+                          data: Optional[bytes] = None) -> Optional[str]:
+    """
+    Заблаговременная загрузка изображения в Telegram ради file_id
+    
+    Изображение отправляется в служебный чат без уведомления, после чего
+    сообщение удаляется. Рассылка затем сразу идет по file_id.
+    
+    Args:
+        bot: Экземпляр бота
+        chat_id: Служебный чат для загрузки
+        schedule_path: Путь к файлу с расписанием
+        content_hash: Хэш содержимого
+        data: Содержимое изображения, если оно уже в памяти
+    
+    Returns:
+        file_id или None, если загрузить не удалось
+    """
+    file_id = await get_cached_file_id(content_hash)
+    if file_id:
+        return file_id
+    
+    try:
+        send = partial(bot.send_photo, chat_id=chat_id, disable_notification=True)
+        message = await send_schedule_photo(send, schedule_path, "📅 Расписание подготовлено к рассылке",
+                                            content_hash, data)
+    except TelegramAPIError as e:
+        logger.error(f"Не удалось заранее загрузить изображение {content_hash}: {e}")
+        return None
+    
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось удалить служебное сообщение: {e}")
+    
+    return await get_cached_file_id(content_hash)
+
@@ -0,0 +1,414 @@
+"""
+Модуль метрик бота в текстовом формате Prometheus
+Запись метрики - это обновление числа в словаре, без блокировок и
+ввода-вывода; текст формируется только при запросе /metrics, поэтому
+без сборщика метрик накладные расходы почти нулевые
+"""
+
+import bisect
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Префикс имен всех метрик
+NAMESPACE = "schedule_bot"
+
+# Границы гистограмм длительности (в секундах)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Границы для быстрых операций (разбор HTML, запросы к SQLite)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Тип содержимого ответа /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Все созданные метрики в порядке создания
+_registry: List["Metric"] = []
+
+
+def _format_value(value: float) -> str:
+    """Число в формате Prometheus"""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric(ABC):
+    """Базовый класс метрики с метками"""
+    
+    type_name = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Args:
+            name: Имя метрики (без префикса NAMESPACE)
+            documentation: Описание для строки # HELP
+            labelnames: Имена меток
+        """
+        self.name = f"{NAMESPACE}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+    
+    def labels(self, *values) -> object:
+        """
+        Значение метрики для набора меток
+        
+        Результат можно сохранить и обновлять без повторного поиска.
+        
+        Args:
+            values: Значения меток в порядке labelnames
+        
+        Returns:
+            Дочерняя метрика
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {key}")
+            child = self._children[key] = self._new_child()
+        return child
+    
+    @abstractmethod
+    def _new_child(self) -> object:
+        """Новое значение метрики для набора меток"""
+    
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        """Метки в формате {name="value",...}"""
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений метрики"""
+    
+    def render(self) -> str:
+        """Метрика в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _CounterValue:
+    """Значение счетчика для одного набора меток"""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1):
+        """Увеличение счетчика"""
+        self.value += amount
+
+
+class Counter(Metric):
+    """Счетчик, который только растет (скорость считает сборщик метрик)"""
+    
+    type_name = "counter"
+    
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+    
+    def inc(self, amount: float = 1):
+        """Увеличение счетчика без меток"""
+        self.labels().inc(amount)
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._label_text(key)} {_format_value(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class _GaugeValue:
+    """Значение показателя для одного набора меток"""
+    
+    __slots__ = ('value', 'function')
+    
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+    
+    def set(self, value: float):
+        """Установка значения"""
+        self.value = value
+    
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """
+        Значение вычисляется функцией только при запросе метрик
+        
+        Args:
+            function: Функция без аргументов или None, чтобы вернуть
+                сохраненное значение (по умолчанию 0)
+        """
+        self.function = function
+        if function is None:
+            self.value = 0.0
+    
+    def get(self) -> float:
+        """Текущее значение"""
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception as e:
+                logger.error(f"Ошибка вычисления метрики: {e}")
+        return self.value
+
+
+class Gauge(Metric):
+    """Показатель, который может расти и уменьшаться (например, длина очереди)"""
+    
+    type_name = "gauge"
+    
+    def _new_child(self) -> _GaugeValue:
+        return _GaugeValue()
+    
+    def set(self, value: float):
+        """Установка значения без меток"""
+        self.labels().set(value)
+    
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """Вычисление значения без меток при запросе (см. _GaugeValue.set_function)"""
+        self.labels().set_function(function)
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._label_text(key)} {_format_value(child.get())}"
+            for key, child in self._children.items()
+        ]
+
+
+class _Timer:
+    """Контекстный менеджер замера длительности блока"""
+    
+    __slots__ = ('histogram', 'started')
+    
+    def __init__(self, histogram: "_HistogramValue"):
+        self.histogram = histogram
+        self.started = 0.0
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _HistogramValue:
+    """Распределение значений для одного набора меток"""
+    
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Число значений в каждом интервале (последний - выше всех границ);
+        # накопленные суммы считаются только при выводе
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        """Добавление значения"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def time(self) -> _Timer:
+        """Замер длительности блока with"""
+        return _Timer(self)
+
+
+class Histogram(Metric):
+    """Гистограмма (например, длительность запросов)"""
+    
+    type_name = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Args:
+            name: Имя метрики (без префикса NAMESPACE)
+            documentation: Описание для строки # HELP
+            labelnames: Имена меток
+            buckets: Верхние границы интервалов по возрастанию
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+    
+    def observe(self, value: float):
+        """Добавление значения без меток"""
+        self.labels().observe(value)
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {child.count}")
+        return lines
+
+
+def render() -> str:
+    """
+    Все метрики в текстовом формате Prometheus
+    
+    Returns:
+        Текст для ответа на /metrics
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Сайт колледжа
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Запросы к сайту колледжа по типу и статусу ответа",
+    ("operation", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Длительность запросов к сайту колледжа", ("operation",)
+)
+PARSE_SECONDS = Histogram(
+    "parse_seconds", "Длительность разбора HTML", ("page",), buckets=FAST_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "schedule_cache_lookups_total", "Обращения к кэшу расписаний по результату", ("result",)
+)
+
+# База данных
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Длительность вызовов методов Database (с ожиданием потока БД)",
+    ("method",), buckets=FAST_BUCKETS
+)
+WRITE_BEHIND_PENDING = Gauge(
+    "db_write_behind_pending", "Операции в буфере отложенной записи"
+)
+
+# Рассылка
+BROADCAST_MESSAGES = Counter(
+    "broadcast_messages_total", "Итоги отправки расписания получателям", ("status",)
+)
+BROADCAST_RETRIES = Counter(
+    "broadcast_retries_total", "Повторные постановки получателей в очередь", ("reason",)
+)
+BROADCAST_SEND_SECONDS = Histogram(
+    "broadcast_send_seconds", "Длительность одного запроса отправки фото"
+)
+BROADCAST_QUEUE_DEPTH = Gauge(
+    "broadcast_queue_depth", "Получатели в очереди текущей рассылки"
+)
+BROADCAST_RATE_GAUGE = Gauge(
+    "broadcast_rate_limit", "Текущий лимит скорости рассылки (сообщений в секунду)"
+)
+
+# Обновления от Telegram
+HANDLER_SECONDS = Histogram(
+    "handler_seconds", "Длительность обработчиков обновлений", ("handler",)
+)
+WEBHOOK_REQUESTS = Counter(
+    "webhook_requests_total", "Запросы к webhook по результату", ("result",)
+)
+WEBHOOK_QUEUE_DEPTH = Gauge(
+    "webhook_queue_depth", "Принятые, но еще не обработанные обновления"
+)
+
+# Ошибки по месту возникновения и классу исключения
+ERRORS = Counter("errors_total", "Ошибки по компоненту и классу исключения", ("component", "error"))
+
+
+def count_error(component: str, error: BaseException):
+    """
+    Учет ошибки в метрике errors_total
+    
+    Args:
+        component: Где произошла ошибка (parser, broadcast, handler, ...)
+        error: Исключение
+    """
+    ERRORS.labels(component, type(error).__name__).inc()
+
+
+def observe_request(operation: str, status, started: float):
+    """
+    Учет запроса к сайту колледжа
+    
+    Args:
+        operation: Тип запроса (page или image)
+        status: HTTP статус ответа или "error", если ответа нет
+        started: Время начала запроса (time.perf_counter())
+    """
+    HTTP_REQUEST_SECONDS.labels(operation).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(operation, status).inc()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замер длительности и учет ошибок обработчиков aiogram"""
+    
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            count_error("handler", e)
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Ответ на запрос /metrics"""
+    return web.Response(text=render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str = METRICS_HOST,
+                               port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """
+    Запуск HTTP сервера с метриками (GET /metrics)
+    
+    Args:
+        host: Адрес (по умолчанию только локальный)
+        port: Порт; 0 - сервер не запускается
+    
+    Returns:
+        Запущенный сервер (остановка - runner.cleanup()) или None
+    """
+    if not port:
+        return None
+    
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
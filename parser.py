@@ -1,300 +1,1150 @@
-"""
-Модуль для парсинга расписания с сайта колледжа
-"""
-
-import aiohttp
-import hashlib
-import logging
-import os
-import re
-from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-from typing import Optional, Tuple, List
-from config import COLLEGE_URL, SCHEDULE_FOLDER
-
-logger = logging.getLogger(__name__)
-
-
-class ScheduleParser:
-    """Класс для парсинга и отслеживания обновлений расписания"""
-    
-    def __init__(self):
-        self.last_hash_file = "last_schedule_hash.txt"
-        self.last_schedule_path = None
-    
-    async def fetch_page(self, url: str) -> Optional[str]:
-        """
-        Загрузка HTML страницы
-        
-        Args:
-            url: URL страницы для загрузки
-            
-        Returns:
-            HTML контент или None при ошибке
-        """
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=30) as response:
-                    if response.status == 200:
-                        return await response.text()
-                    else:
-                        logger.error(f"Ошибка загрузки страницы: статус {response.status}")
-                        return None
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка сети при загрузке страницы: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при загрузке страницы: {e}")
-            return None
-    
-    async def download_image(self, image_url: str, save_path: str) -> bool:
-        """
-        Скачивание изображения
-        
-        Args:
-            image_url: URL изображения
-            save_path: Путь для сохранения
-            
-        Returns:
-            True если успешно, False при ошибке
-        """
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url, timeout=30) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        with open(save_path, 'wb') as f:
-                            f.write(content)
-                        logger.info(f"Изображение сохранено: {save_path}")
-                        return True
-                    else:
-                        logger.error(f"Ошибка загрузки изображения: статус {response.status}")
-                        return False
-        except Exception as e:
-            logger.error(f"Ошибка при скачивании изображения: {e}")
-            return False
-    
-    def calculate_hash(self, data: bytes) -> str:
-        """
-        Вычисление хэша данных для отслеживания изменений
-        
-        Args:
-            data: Данные для хэширования
-            
-        Returns:
-            MD5 хэш в виде строки
-        """
-        return hashlib.md5(data).hexdigest()
-    
-    def get_last_hash(self) -> Optional[str]:
-        """
-        Получение последнего сохраненного хэша
-        
-        Returns:
-            Хэш или None если файл не существует
-        """
-        try:
-            if os.path.exists(self.last_hash_file):
-                with open(self.last_hash_file, 'r') as f:
-                    return f.read().strip()
-        except Exception as e:
-            logger.error(f"Ошибка чтения хэша: {e}")
-        return None
-    
-    def save_hash(self, hash_value: str):
-        """
-        Сохранение хэша в файл
-        
-        Args:
-            hash_value: Хэш для сохранения
-        """
-        try:
-            with open(self.last_hash_file, 'w') as f:
-                f.write(hash_value)
-        except Exception as e:
-            logger.error(f"Ошибка сохранения хэша: {e}")
-    
-    async def parse_schedule_images(self, html: str) -> list:
-        """
-        Парсинг изображений расписания из HTML
-        
-        Args:
-            html: HTML контент страницы
-            
-        Returns:
-            Список URL изображений
-        """
-        try:
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Поиск изображений расписания
-            images = []
-            
-            # Ищем изображения в папке /R7/ (там хранится расписание)
-            for img in soup.find_all('img'):
-                src = img.get('src', '')
-                
-                # Фильтруем только изображения из папки /R7/ (расписание)
-                if src and '/R7/' in src:
-                    # Формируем полный URL
-                    if src.startswith('http'):
-                        images.append(src)
-                    else:
-                        # Убираем /blog/ из базового URL и добавляем путь к изображению
-                        base_url = "https://lsxt.my1.ru"
-                        full_url = f"{base_url}{src}" if src.startswith('/') else f"{base_url}/{src}"
-                        images.append(full_url)
-                        logger.info(f"Найдено расписание: {full_url}")
-            
-            # Если не нашли в /R7/, ищем по другим признакам
-            if not images:
-                logger.warning("Изображения в /R7/ не найдены, ищем по другим признакам...")
-                for img in soup.find_all('img'):
-                    src = img.get('src', '')
-                    # Ищем изображения с расписанием в названии или большие изображения
-                    if src and any(keyword in src.lower() for keyword in ['raspisanie', 'schedule', 'rasp']):
-                        if src.startswith('http'):
-                            images.append(src)
-                        else:
-                            base_url = "https://lsxt.my1.ru"
-                            full_url = f"{base_url}{src}" if src.startswith('/') else f"{base_url}/{src}"
-                            images.append(full_url)
-            
-            logger.info(f"Найдено изображений расписания: {len(images)}")
-            return images
-            
-        except Exception as e:
-            logger.error(f"Ошибка парсинга HTML: {e}")
-            return []
-    
-    async def find_schedule_by_date(self, target_date: datetime) -> Optional[str]:
-        """
-        Поиск расписания на конкретную дату
-        
-        Args:
-            target_date: Дата для поиска расписания
-            
-        Returns:
-            URL изображения расписания или None
-        """
-        try:
-            # Формируем URL страницы с расписанием на нужную дату
-            # Формат: https://lsxt.my1.ru/blog/YYYY-MM-DD
-            date_str = target_date.strftime('%Y-%m-%d')
-            page_url = f"https://lsxt.my1.ru/blog/{date_str}"
-            
-            logger.info(f"Загружаем страницу: {page_url}")
-            
-            # Загружаем страницу с расписанием
-            html = await self.fetch_page(page_url)
-            if not html:
-                logger.warning(f"Не удалось загрузить страницу для {date_str}")
-                return None
-            
-            # Ищем изображение расписания на странице
-            images = await self.parse_schedule_images(html)
-            if images:
-                logger.info(f"Найдено расписание на {date_str}: {images[0]}")
-                return images[0]
-            
-            logger.warning(f"Расписание на {date_str} не найдено")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Ошибка при поиске расписания по дате: {e}", exc_info=True)
-            return None
-
-    async def check_for_updates(self) -> Tuple[bool, Optional[str]]:
-        """
-        Проверка наличия нового расписания на завтра
-        
-        Returns:
-            Кортеж (есть_обновление, путь_к_файлу)
-        """
-        try:
-            logger.info("Проверка обновлений расписания...")
-            
-            # Ищем расписание на завтра
-            tomorrow = datetime.now() + timedelta(days=1)
-            image_url = await self.find_schedule_by_date(tomorrow)
-            
-            if not image_url:
-                logger.warning("Расписание на завтра не найдено")
-                return False, None
-            
-            logger.info(f"Найдено изображение: {image_url}")
-            
-            # Скачиваем изображение во временный файл для проверки
-            temp_path = os.path.join(SCHEDULE_FOLDER, "temp_schedule.jpg")
-            if not await self.download_image(image_url, temp_path):
-                return False, None
-            
-            # Вычисляем хэш нового изображения
-            with open(temp_path, 'rb') as f:
-                new_hash = self.calculate_hash(f.read())
-            
-            # Сравниваем с предыдущим хэшем
-            last_hash = self.get_last_hash()
-            
-            if last_hash != new_hash:
-                # Новое расписание найдено!
-                logger.info("Обнаружено новое расписание!")
-                
-                # Сохраняем с уникальным именем
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                final_path = os.path.join(SCHEDULE_FOLDER, f"schedule_{timestamp}.jpg")
-                os.rename(temp_path, final_path)
-                
-                # Сохраняем новый хэш
-                self.save_hash(new_hash)
-                self.last_schedule_path = final_path
-                
-                return True, final_path
-            else:
-                logger.info("Расписание не изменилось")
-                # Удаляем временный файл
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                return False, None
-                
-        except Exception as e:
-            logger.error(f"Ошибка при проверке обновлений: {e}", exc_info=True)
-            return False, None
-    
-    async def get_schedule_for_date(self, target_date: datetime) -> Optional[str]:
-        """
-        Получение расписания на конкретную дату
-        
-        Args:
-            target_date: Дата для получения расписания
-            
-        Returns:
-            Путь к сохраненному файлу или None
-        """
-        try:
-            logger.info(f"Получение расписания на {target_date.strftime('%d.%m.%Y')}")
-            
-            # Ищем расписание на указанную дату
-            image_url = await self.find_schedule_by_date(target_date)
-            
-            if not image_url:
-                logger.warning(f"Расписание на {target_date.strftime('%d.%m.%Y')} не найдено")
-                return None
-            
-            # Скачиваем изображение
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_path = os.path.join(SCHEDULE_FOLDER, f"schedule_{timestamp}.jpg")
-            
-            if await self.download_image(image_url, file_path):
-                logger.info(f"Расписание сохранено: {file_path}")
-                return file_path
-            else:
-                return None
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении расписания: {e}", exc_info=True)
-            return None
-
-
-# Создание глобального экземпляра парсера
-parser = ScheduleParser()
+"""
+Модуль для парсинга расписания с сайта колледжа
+"""
+
+import aiohttp
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from lxml import html as lxml_html
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, List
+from cache import ScheduleCache, ScheduleImage, schedule_page_url
+from config import (
+    COLLEGE_URL, SCHEDULE_FOLDER, DOWNLOAD_CHUNK_SIZE, DISCOVERY_MAX_PAGES,
+    HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_TIMEOUT,
+    SCHEDULE_DIFF_SIZE, SCHEDULE_DIFF_THRESHOLD
+)
+from metrics import CACHE_LOOKUPS, PARSE_SECONDS, count_error, observe_request
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow не обязателен: без него изображения сравниваются только по хэшу байтов
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько HTML страниц держать в памяти для ответов 304 Not Modified
+PAGE_BODY_CACHE_SIZE = 64
+
+# Сколько валидаторов HTTP изображений хранить (в памяти и в файле)
+VALIDATORS_CACHE_SIZE = 256
+
+# Сколько отпечатков изображений держать в памяти
+FINGERPRINT_CACHE_SIZE = 16
+
+# Допустимое расхождение пропорций изображений, которые считаются одинаковыми
+ASPECT_TOLERANCE = 0.02
+
+# Адрес сайта для относительных ссылок на изображения
+SITE_URL = "https://lsxt.my1.ru"
+
+# Признаки расписания в имени файла (если изображений в /R7/ нет)
+SCHEDULE_KEYWORDS = ('raspisanie', 'schedule', 'rasp')
+
+# Блок записи блога в шаблоне uCoz
+BLOG_ENTRY_XPATH = "//*[contains(concat(' ', normalize-space(@class), ' '), ' eBlock ')]"
+
+# Ссылка на запись блога: /blog/YYYY-MM-DD-N или /blog/название/YYYY-MM-DD-N
+BLOG_ENTRY_RE = re.compile(r'/blog/(?:[^/?#]+/)?(\d{4}-\d{2}-\d{2})-\d+')
+
+# Ссылка на страницу ленты блога: /blog/?page2
+BLOG_PAGE_RE = re.compile(r'/blog/\?page(\d+)$')
+
+# Парсер HTML: на вход подается текст, перекодированный в UTF-8, поэтому
+# кодировка задана явно и не зависит от <meta charset> страницы
+_HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+
+
+def image_fingerprint(path: str, size: int = SCHEDULE_DIFF_SIZE) -> Tuple[float, bytes]:
+    """
+    Отпечаток изображения: пропорции и уменьшенная копия в оттенках серого
+    
+    JPEG декодируется сразу в уменьшенном виде (draft), поэтому расчет
+    занимает миллисекунды даже для больших изображений.
+    
+    Args:
+        path: Путь к файлу изображения
+        size: Сторона уменьшенной копии в пикселях
+    
+    Returns:
+        Кортеж (ширина / высота, яркости пикселей size x size)
+    """
+    with Image.open(path) as img:
+        aspect = img.width / img.height
+        img.draft('L', (size * 4, size * 4))
+        thumbnail = img.convert('L').resize((size, size), Image.BILINEAR)
+        return aspect, thumbnail.tobytes()
+
+
+def _parse_html(html: str):
+    """Разбор HTML в дерево lxml (None для пустой страницы)"""
+    if not html or not html.strip():
+        return None
+    return lxml_html.fromstring(html.encode('utf-8'), parser=_HTML_PARSER)
+
+
+def select_schedule_images(sources: Iterable[str]) -> List[str]:
+    """
+    Выбор изображений расписания среди значений src тегов <img>
+    
+    Приоритет у изображений из папки /R7/ (там хранится расписание),
+    если их нет - подходят изображения с признаками расписания в имени.
+    
+    Args:
+        sources: Значения атрибутов src в порядке следования на странице
+    
+    Returns:
+        Список абсолютных URL изображений
+    """
+    images = []
+    candidates = []
+    for src in sources:
+        if not src:
+            continue
+        if '/R7/' in src:
+            images.append(absolute_url(src))
+        elif not images:
+            lowered = src.lower()
+            if any(keyword in lowered for keyword in SCHEDULE_KEYWORDS):
+                candidates.append(absolute_url(src))
+    return images or candidates
+
+
+def extract_schedule_images(html: str) -> List[str]:
+    """
+    Извлечение URL изображений расписания из HTML страницы
+    
+    Страница разбирается lxml без построения дерева BeautifulSoup, из
+    документа берутся только атрибуты src тегов <img> за один проход.
+    
+    Args:
+        html: HTML контент страницы
+    
+    Returns:
+        Список URL изображений
+    """
+    document = _parse_html(html)
+    if document is None:
+        return []
+    
+    images = select_schedule_images(document.xpath('//img/@src'))
+    
+    if any('/R7/' in url for url in images):
+        for url in images:
+            logger.info(f"Найдено расписание: {url}")
+    else:
+        logger.warning("Изображения в /R7/ не найдены, ищем по другим признакам...")
+    
+    return images
+
+
+def extract_blog_entries(html: str) -> Tuple[Dict[str, List[str]], Dict[int, str]]:
+    """
+    Извлечение расписаний по датам из ленты блога
+    
+    Дата берется из ссылки на запись (как в архиве /blog/YYYY-MM-DD),
+    изображения - из тела записи по тем же правилам, что и на странице
+    даты. Если на одну дату несколько записей, изображения идут в
+    порядке записей в ленте.
+    
+    Args:
+        html: HTML страницы ленты блога
+    
+    Returns:
+        Кортеж (дата YYYY-MM-DD -> список URL изображений, пустой, если
+        в записях за дату нет расписания; номер страницы ленты -> URL)
+    """
+    document = _parse_html(html)
+    if document is None:
+        return {}, {}
+    
+    entries: Dict[str, List[str]] = {}
+    for block in document.xpath(BLOG_ENTRY_XPATH):
+        date_key = None
+        for href in block.xpath('.//a/@href'):
+            match = BLOG_ENTRY_RE.search(href)
+            if match:
+                date_key = match.group(1)
+                break
+        if date_key is None:
+            continue
+        
+        images = select_schedule_images(block.xpath('.//img/@src'))
+        known = entries.setdefault(date_key, [])
+        known.extend(url for url in images if url not in known)
+    
+    pages = {}
+    for href in document.xpath('//a/@href'):
+        match = BLOG_PAGE_RE.search(href)
+        if match:
+            pages[int(match.group(1))] = absolute_url(href)
+    
+    return entries, pages
+
+
+def absolute_url(src: str) -> str:
+    """
+    Полный URL по значению атрибута src или href
+    
+    Args:
+        src: Значение атрибута
+    
+    Returns:
+        Абсолютный URL
+    """
+    if src.startswith('http'):
+        return src
+    return f"{SITE_URL}{src}" if src.startswith('/') else f"{SITE_URL}/{src}"
+
+
+class ScheduleParser:
+    """Класс для парсинга и отслеживания обновлений расписания"""
+    
+    def __init__(self):
+        self.last_hash_file = "last_schedule_hash.txt"
+        self.validators_file = "http_validators.json"
+        self.last_schedule_path = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache = ScheduleCache()
+        # Запросы, которые выполняются прямо сейчас: ключ -> общая задача
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Валидаторы HTTP (ETag, Last-Modified, Content-Length) по URL.
+        # В файл попадают только валидаторы изображений: валидаторы страниц
+        # полезны, пока HTML страницы лежит в _page_bodies, и удаляются вместе с ним
+        self._validators: "OrderedDict[str, dict]" = self._load_validators()
+        self._validators_dirty = False
+        self._validators_lock: Optional[asyncio.Lock] = None
+        # Последние загруженные страницы: URL -> HTML (для ответов 304)
+        self._page_bodies: "OrderedDict[str, str]" = OrderedDict()
+        # Счетчик неудачных запросов страниц (сеть, ошибки сервера)
+        self.fetch_errors = 0
+        # Отпечатки изображений для сравнения по содержимому: хэш -> отпечаток
+        self._fingerprints: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+    
+    async def start(self):
+        """
+        Создание общей HTTP-сессии с пулом соединений
+        
+        Сессия живет все время работы бота, поэтому соединения с сайтом
+        колледжа переиспользуются (keep-alive) вместо нового TCP+TLS
+        рукопожатия на каждый запрос.
+        """
+        if self.session is not None and not self.session.closed:
+            return
+        
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+        logger.info("HTTP-сессия парсера создана")
+        
+        # Индекс дат из старой версии переносится в БД
+        await self.cache.import_legacy_index()
+        
+        # Заодно убираем из хранилища устаревшие изображения
+        await self.cleanup_store()
+    
+    async def close(self):
+        """Закрытие общей HTTP-сессии и всех соединений пула"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            logger.info("HTTP-сессия парсера закрыта")
+        self.session = None
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Получение общей HTTP-сессии
+        
+        Если сессия еще не создана (например, парсер используется
+        из отдельного скрипта), она создается при первом обращении.
+        
+        Returns:
+            Открытая сессия aiohttp
+        """
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+    
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable]):
+        """
+        Объединение одновременных одинаковых запросов в один
+        
+        Первый вызывающий запускает задачу, остальные с тем же ключом
+        ждут ее результат (или исключение). Задача защищена от отмены:
+        если один из ожидающих отменен, остальные все равно получат ответ.
+        
+        Args:
+            key: Ключ запроса (например, дата или URL)
+            factory: Функция, создающая корутину запроса
+            
+        Returns:
+            Результат общей задачи
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish_flight(key, t))
+        return await asyncio.shield(task)
+    
+    def _finish_flight(self, key: str, task: asyncio.Task):
+        """Удаление завершенной задачи из списка выполняющихся"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Забираем исключение, даже если все ожидающие были отменены
+        if not task.cancelled():
+            task.exception()
+    
+    def _load_validators(self) -> "OrderedDict[str, dict]":
+        """Загрузка сохраненных валидаторов HTTP изображений"""
+        validators = OrderedDict()
+        try:
+            if os.path.exists(self.validators_file):
+                with open(self.validators_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # В старых файлах есть и валидаторы страниц - без HTML они не нужны
+                validators.update((url, entry) for url, entry in data.items()
+                                  if entry.get('content_hash'))
+        except Exception as e:
+            logger.error(f"Ошибка чтения валидаторов HTTP: {e}")
+        while len(validators) > VALIDATORS_CACHE_SIZE:
+            validators.popitem(last=False)
+        return validators
+    
+    def _write_validators(self, snapshot: Dict[str, dict]) -> bool:
+        """Запись валидаторов в файл (выполняется в пуле потоков)"""
+        tmp_path = self.validators_file + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.validators_file)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения валидаторов HTTP: {e}")
+            return False
+    
+    async def _save_validators(self):
+        """
+        Сохранение валидаторов HTTP изображений, если они менялись
+        
+        В цикле событий снимается только копия, запись идет в пуле потоков.
+        Одновременные сохранения выполняются по очереди, поэтому более
+        старая копия не перезапишет новую.
+        """
+        if self._validators_lock is None:
+            self._validators_lock = asyncio.Lock()
+        
+        async with self._validators_lock:
+            if not self._validators_dirty:
+                return
+            snapshot = {url: dict(entry) for url, entry in self._validators.items()
+                        if entry.get('content_hash')}
+            self._validators_dirty = False
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(None, self._write_validators, snapshot):
+                self._validators_dirty = True
+    
+    def has_validators(self, url: str) -> bool:
+        """
+        Проверка, можно ли отправить условный запрос для URL
+        
+        Args:
+            url: URL ресурса
+            
+        Returns:
+            True если сайт присылал ETag или Last-Modified
+        """
+        entry = self._validators.get(url)
+        return bool(entry and (entry.get('etag') or entry.get('last_modified')))
+    
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        """Заголовки If-None-Match / If-Modified-Since для URL"""
+        entry = self._validators.get(url) or {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    async def _remember_validators(self, url: str, response: aiohttp.ClientResponse,
+                                   content_hash: Optional[str] = None):
+        """
+        Запоминание валидаторов из ответа 200
+        
+        Хранится не больше VALIDATORS_CACHE_SIZE записей, самые давние
+        вытесняются. Файл переписывается только при изменении валидаторов
+        изображений (с content_hash).
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            # Сайт не прислал валидаторов - останется сравнение по хэшу
+            removed = self._validators.pop(url, None)
+            if removed and removed.get('content_hash'):
+                self._validators_dirty = True
+                await self._save_validators()
+            return
+        
+        self._validators[url] = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_length': response.headers.get('Content-Length'),
+            'content_hash': content_hash
+        }
+        self._validators.move_to_end(url)
+        while len(self._validators) > VALIDATORS_CACHE_SIZE:
+            _, evicted = self._validators.popitem(last=False)
+            self._validators_dirty |= bool(evicted.get('content_hash'))
+        if content_hash:
+            self._validators_dirty = True
+        if self._validators_dirty:
+            await self._save_validators()
+    
+    async def fetch_page(self, url: str) -> Optional[str]:
+        """
+        Загрузка HTML страницы
+        
+        Если страница уже загружалась и сайт прислал ETag/Last-Modified,
+        отправляется условный запрос: при ответе 304 возвращается
+        сохраненный HTML без повторной загрузки.
+        
+        Args:
+            url: URL страницы для загрузки
+            
+        Returns:
+            HTML контент или None при ошибке
+        """
+        started = time.perf_counter()
+        status = "error"
+        try:
+            headers = self._conditional_headers(url) if url in self._page_bodies else {}
+            session = await self.get_session()
+            async with session.get(url, headers=headers) as response:
+                status = response.status
+                if response.status == 304 and url in self._page_bodies:
+                    logger.info(f"Страница не изменилась: {url}")
+                    self._page_bodies.move_to_end(url)
+                    return self._page_bodies[url]
+                elif response.status == 200:
+                    html = await response.text()
+                    await self._remember_validators(url, response)
+                    self._page_bodies[url] = html
+                    self._page_bodies.move_to_end(url)
+                    if len(self._page_bodies) > PAGE_BODY_CACHE_SIZE:
+                        # Без HTML ответ 304 бесполезен - валидаторы страницы тоже не нужны
+                        evicted_url, _ = self._page_bodies.popitem(last=False)
+                        self._validators.pop(evicted_url, None)
+                    return html
+                else:
+                    logger.error(f"Ошибка загрузки страницы: статус {response.status}")
+                    if response.status >= 500:
+                        self.fetch_errors += 1
+                    return None
+        except aiohttp.ClientError as e:
+            logger.error(f"Ошибка сети при загрузке страницы: {e}")
+            count_error("parser", e)
+            self.fetch_errors += 1
+            return None
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при загрузке страницы: {e}")
+            count_error("parser", e)
+            self.fetch_errors += 1
+            return None
+        finally:
+            observe_request("page", status, started)
+    
+    async def _stream_to_file(self, response: aiohttp.ClientResponse, path: str) -> str:
+        """
+        Потоковая запись тела ответа в файл
+        
+        Тело читается кусками по DOWNLOAD_CHUNK_SIZE, каждый кусок сразу
+        хэшируется и пишется в файл в отдельном потоке, поэтому в памяти
+        держится не больше одного куска, а цикл событий не блокируется.
+        При ошибке недописанный файл удаляется.
+        
+        Args:
+            response: Ответ сервера со статусом 200
+            path: Путь к файлу
+            
+        Returns:
+            MD5 хэш содержимого
+        """
+        loop = asyncio.get_running_loop()
+        hasher = hashlib.md5()
+        
+        f = await loop.run_in_executor(None, open, path, 'wb')
+        try:
+            try:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    await loop.run_in_executor(None, f.write, chunk)
+            finally:
+                await loop.run_in_executor(None, f.close)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        
+        return hasher.hexdigest()
+    
+    async def _download_to_store(self, response: aiohttp.ClientResponse,
+                                 image_url: str) -> Tuple[str, str]:
+        """
+        Потоковое скачивание изображения в хранилище
+        
+        Имя файла известно только после хэширования, поэтому файл
+        сначала пишется под временным именем в папке хранилища, а затем
+        атомарно переносится (или удаляется, если такое изображение уже есть).
+        
+        Returns:
+            Кортеж (хэш_содержимого, путь_к_файлу)
+        """
+        store = self.cache.store
+        staging_path = store.staging_path()
+        content_hash = await self._stream_to_file(response, staging_path)
+        path = await store.commit(staging_path, content_hash, image_url)
+        
+        await self._remember_validators(image_url, response, content_hash)
+        # Вытеснение не после каждой загрузки, а по интервалу или при превышении лимита
+        if store.eviction_due:
+            await self.cleanup_store()
+        return content_hash, path
+    
+    async def cleanup_store(self) -> int:
+        """
+        Удаление старых изображений из хранилища
+        
+        Изображения на сегодня и будущие даты, а также последнее
+        разосланное расписание не удаляются.
+        
+        Returns:
+            Количество удаленных файлов
+        """
+        protected = await self.cache.active_hashes(datetime.now().strftime('%Y-%m-%d'))
+        last_hash = self.get_last_hash()
+        if last_hash:
+            protected.add(last_hash)
+        return await self.cache.store.evict(protected)
+    
+    async def fetch_image(self, image_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Скачивание изображения в хранилище кэша
+        
+        Одновременные запросы одного URL выполняются одной загрузкой.
+        
+        Args:
+            image_url: URL изображения
+            
+        Returns:
+            Кортеж (хэш_содержимого, путь_к_файлу) или (None, None) при ошибке
+        """
+        return await self._single_flight(f"image:{image_url}", lambda: self._fetch_image(image_url))
+    
+    async def _fetch_image(self, image_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Скачивание изображения без объединения запросов"""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            session = await self.get_session()
+            async with session.get(image_url) as response:
+                status = response.status
+                if response.status == 200:
+                    return await self._download_to_store(response, image_url)
+                else:
+                    logger.error(f"Ошибка загрузки изображения: статус {response.status}")
+                    return None, None
+        except Exception as e:
+            logger.error(f"Ошибка при скачивании изображения: {e}")
+            count_error("parser", e)
+            return None, None
+        finally:
+            observe_request("image", status, started)
+    
+    async def revalidate_image(self, image_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Условная загрузка изображения (If-None-Match / If-Modified-Since)
+        
+        Если изображение не изменилось (ответ 304), оно не скачивается:
+        возвращается хэш, сохраненный при прошлой загрузке. Если сайт
+        не присылает валидаторов, изображение скачивается целиком.
+        
+        Args:
+            image_url: URL изображения
+            
+        Returns:
+            Кортеж (хэш_содержимого, путь_к_файлу). При ответе 304 путь
+            равен None; при ошибке оба значения равны None.
+        """
+        return await self._single_flight(
+            f"revalidate:{image_url}", lambda: self._revalidate_image(image_url)
+        )
+    
+    async def _revalidate_image(self, image_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Условная загрузка изображения без объединения запросов"""
+        entry = self._validators.get(image_url)
+        if not self.has_validators(image_url) or not entry.get('content_hash'):
+            return await self.fetch_image(image_url)
+        
+        started = time.perf_counter()
+        status = "error"
+        try:
+            session = await self.get_session()
+            headers = self._conditional_headers(image_url)
+            async with session.get(image_url, headers=headers) as response:
+                status = response.status
+                if response.status == 304:
+                    logger.info(f"Изображение не изменилось: {image_url}")
+                    self._validators.move_to_end(image_url)
+                    return entry['content_hash'], None
+                elif response.status == 200:
+                    return await self._download_to_store(response, image_url)
+                else:
+                    logger.error(f"Ошибка загрузки изображения: статус {response.status}")
+                    return None, None
+        except Exception as e:
+            logger.error(f"Ошибка при скачивании изображения: {e}")
+            count_error("parser", e)
+            return None, None
+        finally:
+            observe_request("image", status, started)
+    
+    async def download_image(self, image_url: str, save_path: str) -> bool:
+        """
+        Скачивание изображения
+        
+        Изображение скачивается в хранилище (или берется оттуда, если
+        не изменилось) и копируется по указанному пути.
+        
+        Args:
+            image_url: URL изображения
+            save_path: Путь для сохранения
+            
+        Returns:
+            True если успешно, False при ошибке
+        """
+        content_hash, path = await self.revalidate_image(image_url)
+        if content_hash is None:
+            return False
+        if path is None:
+            path = self.cache.path_for(content_hash)
+            if not os.path.exists(path):
+                content_hash, path = await self.fetch_image(image_url)
+                if content_hash is None:
+                    return False
+        
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, shutil.copyfile, path, save_path)
+            logger.info(f"Изображение сохранено: {save_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении изображения: {e}")
+            return False
+    
+    def calculate_hash(self, data: bytes) -> str:
+        """
+        Вычисление хэша данных для отслеживания изменений
+        
+        Args:
+            data: Данные для хэширования
+            
+        Returns:
+            MD5 хэш в виде строки
+        """
+        return hashlib.md5(data).hexdigest()
+    
+    async def get_fingerprint(self, content_hash: str) -> Optional[Tuple[float, bytes]]:
+        """
+        Отпечаток изображения из хранилища (см. image_fingerprint)
+        
+        Args:
+            content_hash: Хэш содержимого
+        
+        Returns:
+            Отпечаток или None, если Pillow не установлен или файла нет
+        """
+        if Image is None:
+            return None
+        
+        fingerprint = self._fingerprints.get(content_hash)
+        if fingerprint is None:
+            path = self.cache.path_for(content_hash)
+            loop = asyncio.get_running_loop()
+            try:
+                fingerprint = await loop.run_in_executor(None, image_fingerprint, path)
+            except Exception as e:
+                logger.warning(f"Не удалось построить отпечаток изображения {content_hash}: {e}")
+                return None
+            self._fingerprints[content_hash] = fingerprint
+            if len(self._fingerprints) > FINGERPRINT_CACHE_SIZE:
+                self._fingerprints.popitem(last=False)
+        else:
+            self._fingerprints.move_to_end(content_hash)
+        return fingerprint
+    
+    async def is_same_content(self, first_hash: str, second_hash: str) -> bool:
+        """
+        Проверка, что два изображения показывают одно и то же расписание
+        
+        Одинаковые байты - одинаковое содержимое. Иначе сравниваются
+        уменьшенные копии: перекодирование или повторная загрузка того же
+        расписания меняет яркость пикселей лишь на единицы, а измененная
+        ячейка таблицы - на десятки. Изображения считаются одинаковыми, если
+        ни один пиксель не отличается больше чем на SCHEDULE_DIFF_THRESHOLD.
+        
+        Args:
+            first_hash: Хэш содержимого первого изображения
+            second_hash: Хэш содержимого второго изображения
+        
+        Returns:
+            True если содержимое совпадает (без Pillow - только при равных хэшах)
+        """
+        if first_hash == second_hash:
+            return True
+        
+        first = await self.get_fingerprint(first_hash)
+        second = await self.get_fingerprint(second_hash)
+        if first is None or second is None:
+            return False
+        
+        if abs(first[0] - second[0]) > ASPECT_TOLERANCE * first[0]:
+            return False
+        difference = max(abs(a - b) for a, b in zip(first[1], second[1]))
+        logger.info(f"Разница изображений {first_hash} и {second_hash}: {difference}")
+        return difference <= SCHEDULE_DIFF_THRESHOLD
+    
+    def get_last_hash(self) -> Optional[str]:
+        """
+        Получение последнего сохраненного хэша
+        
+        Returns:
+            Хэш или None если файл не существует
+        """
+        try:
+            if os.path.exists(self.last_hash_file):
+                with open(self.last_hash_file, 'r') as f:
+                    return f.read().strip()
+        except Exception as e:
+            logger.error(f"Ошибка чтения хэша: {e}")
+        return None
+    
+    def save_hash(self, hash_value: str):
+        """
+        Сохранение хэша в файл
+        
+        Args:
+            hash_value: Хэш для сохранения
+        """
+        try:
+            with open(self.last_hash_file, 'w') as f:
+                f.write(hash_value)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения хэша: {e}")
+    
+    async def parse_schedule_images(self, html: str) -> list:
+        """
+        Парсинг изображений расписания из HTML
+        
+        Args:
+            html: HTML контент страницы
+            
+        Returns:
+            Список URL изображений
+        """
+        try:
+            with PARSE_SECONDS.labels("day").time():
+                images = extract_schedule_images(html)
+            logger.info(f"Найдено изображений расписания: {len(images)}")
+            return images
+            
+        except Exception as e:
+            logger.error(f"Ошибка парсинга HTML: {e}")
+            return []
+    
+    async def find_schedule_by_date(self, target_date: datetime) -> Optional[str]:
+        """
+        Поиск расписания на конкретную дату
+        
+        Args:
+            target_date: Дата для поиска расписания
+            
+        Returns:
+            URL изображения расписания или None
+        """
+        images = await self.find_schedule_images(target_date)
+        return images[0] if images else None
+    
+    async def find_schedule_images(self, target_date: datetime) -> List[str]:
+        """
+        Поиск всех изображений расписания на странице даты
+        
+        Одновременные поиски одной даты выполняются одним запросом к сайту.
+        
+        Args:
+            target_date: Дата для поиска расписания
+            
+        Returns:
+            Список URL изображений (первое - основное) или пустой список
+        """
+        date_key = target_date.strftime('%Y-%m-%d')
+        return await self._single_flight(f"page:{date_key}", lambda: self._find_schedule_images(target_date))
+    
+    async def _find_schedule_images(self, target_date: datetime) -> List[str]:
+        """Поиск расписания на дату без объединения запросов"""
+        try:
+            # Формируем URL страницы с расписанием на нужную дату
+            # Формат: https://lsxt.my1.ru/blog/YYYY-MM-DD
+            date_str = target_date.strftime('%Y-%m-%d')
+            page_url = schedule_page_url(date_str)
+            
+            logger.info(f"Загружаем страницу: {page_url}")
+            
+            # Загружаем страницу с расписанием
+            html = await self.fetch_page(page_url)
+            if not html:
+                logger.warning(f"Не удалось загрузить страницу для {date_str}")
+                return []
+            
+            # Ищем изображение расписания на странице
+            images = await self.parse_schedule_images(html)
+            if images:
+                logger.info(f"Найдено расписание на {date_str}: {images[0]}")
+                return images
+            
+            logger.warning(f"Расписание на {date_str} не найдено")
+            return []
+            
+        except Exception as e:
+            logger.error(f"Ошибка при поиске расписания по дате: {e}", exc_info=True)
+            return []
+    
+    async def discover_schedules(self, first_date: datetime,
+                                 last_date: datetime) -> Optional[Dict[str, List[str]]]:
+        """
+        Поиск расписаний на период по ленте блога
+        
+        Вместо запроса страницы каждой даты загружается лента блога
+        (COLLEGE_URL) и, если нужно, следующие ее страницы - пока лента
+        не дойдет до первой даты периода. Обычно это 1-2 запроса.
+        
+        Args:
+            first_date: Первая дата периода
+            last_date: Последняя дата периода
+        
+        Returns:
+            Словарь дата YYYY-MM-DD -> список URL изображений для дат
+            периода, на которые в ленте есть записи. Даты, которых нет в
+            словаре, в ленте не встречались - расписания на них нет.
+            None, если ленту не удалось просмотреть до первой даты
+        """
+        first_key = first_date.strftime('%Y-%m-%d')
+        last_key = last_date.strftime('%Y-%m-%d')
+        return await self._single_flight(
+            f"discover:{first_key}:{last_key}", lambda: self._discover_schedules(first_key, last_key)
+        )
+    
+    async def _discover_schedules(self, first_key: str, last_key: str) -> Optional[Dict[str, List[str]]]:
+        """Просмотр ленты блога без объединения запросов"""
+        try:
+            found: Dict[str, List[str]] = {}
+            page_url = COLLEGE_URL
+            page_number = 1
+            
+            while True:
+                html = await self.fetch_page(page_url)
+                if not html:
+                    logger.warning(f"Не удалось загрузить ленту блога: {page_url}")
+                    return None
+                viewed = page_number
+                
+                with PARSE_SECONDS.labels("feed").time():
+                    entries, pages = extract_blog_entries(html)
+                if not entries:
+                    # Записей нет совсем - скорее всего, изменилась разметка сайта
+                    logger.warning(f"В ленте блога не найдено записей: {page_url}")
+                    return None
+                for date_key, images in entries.items():
+                    known = found.setdefault(date_key, [])
+                    known.extend(url for url in images if url not in known)
+                
+                # Лента идет от новых записей к старым
+                if min(entries) < first_key:
+                    break
+                
+                page_number += 1
+                if page_number not in pages:
+                    # Дошли до конца ленты
+                    break
+                if page_number > DISCOVERY_MAX_PAGES:
+                    logger.warning(f"Лента блога не дошла до {first_key} за {DISCOVERY_MAX_PAGES} страниц")
+                    return None
+                page_url = pages[page_number]
+            
+            period = {key: images for key, images in found.items() if first_key <= key <= last_key}
+            published = sum(1 for images in period.values() if images)
+            logger.info(
+                f"Лента блога: просмотрено страниц {viewed}, "
+                f"расписаний с {first_key} по {last_key}: {published}"
+            )
+            return period
+        
+        except Exception as e:
+            logger.error(f"Ошибка при просмотре ленты блога: {e}", exc_info=True)
+            return None
+
+    async def check_for_updates(self) -> Tuple[bool, Optional[str]]:
+        """
+        Проверка наличия нового расписания на завтра
+        
+        Используется только скриптом test_parser.py: бот проверяет
+        исправления через SchedulePoller.check в scheduler.py, который
+        сразу рассылает найденные изменения.
+        
+        Returns:
+            Кортеж (есть_обновление, путь_к_файлу)
+        """
+        try:
+            logger.info("Проверка обновлений расписания...")
+            
+            # Ищем расписание на завтра
+            tomorrow = datetime.now() + timedelta(days=1)
+            image_urls = await self.find_schedule_images(tomorrow)
+            
+            if not image_urls:
+                logger.warning("Расписание на завтра не найдено")
+                return False, None
+            image_url = image_urls[0]
+            
+            logger.info(f"Найдено изображение: {image_url}")
+            
+            # Условный запрос: при ответе 304 изображение не скачивается
+            new_hash, path = await self.revalidate_image(image_url)
+            if new_hash is None:
+                return False, None
+            
+            # Сравниваем с предыдущим хэшем
+            last_hash = self.get_last_hash()
+            
+            if last_hash == new_hash:
+                logger.info("Расписание не изменилось")
+                return False, None
+            
+            if path is None and not os.path.exists(self.cache.path_for(new_hash)):
+                # 304, но файла с этим содержимым уже нет - нужно само изображение
+                new_hash, path = await self.fetch_image(image_url)
+                if new_hash is None:
+                    return False, None
+            
+            # Записываем в индекс кэша (файл уже лежит под именем по хэшу)
+            image = await self.cache.put(tomorrow.strftime('%Y-%m-%d'), image_urls, new_hash)
+            
+            # Сохраняем новый хэш
+            self.save_hash(new_hash)
+            self.last_schedule_path = image.path
+            
+            if last_hash and await self.is_same_content(last_hash, new_hash):
+                # Файл перекодирован или загружен заново, но расписание то же
+                logger.info("Изображение на сайте заменено, но расписание не изменилось")
+                return False, None
+            
+            # Новое расписание найдено!
+            logger.info("Обнаружено новое расписание!")
+            
+            return True, image.path
+                
+        except Exception as e:
+            logger.error(f"Ошибка при проверке обновлений: {e}", exc_info=True)
+            return False, None
+    
+    async def get_schedule_image(self, target_date: datetime) -> Optional[ScheduleImage]:
+        """
+        Получение расписания на дату через двухуровневый кэш
+        
+        Свежая запись кэша отдается без обращения к сайту. Устаревшая
+        перепроверяется: если на странице даты тот же URL изображения,
+        повторное скачивание не нужно. Одновременные запросы одной даты
+        ждут общий результат.
+        
+        Args:
+            target_date: Дата для получения расписания
+            
+        Returns:
+            Изображение расписания или None
+        """
+        date_key = target_date.strftime('%Y-%m-%d')
+        return await self._single_flight(f"schedule:{date_key}", lambda: self._get_schedule_image(target_date))
+    
+    async def refresh_schedule_image(self, target_date: datetime) -> Optional[ScheduleImage]:
+        """
+        Перепроверка расписания на дату на сайте независимо от свежести кэша
+        
+        Страница и изображение запрашиваются условно, поэтому без изменений
+        на сайте проверка почти ничего не скачивает.
+        
+        Args:
+            target_date: Дата для проверки
+        
+        Returns:
+            Актуальная запись кэша (без содержимого в памяти) или None
+        """
+        date_key = target_date.strftime('%Y-%m-%d')
+        return await self._single_flight(
+            f"refresh:{date_key}", lambda: self._lookup_schedule_image(target_date, force=True)
+        )
+    
+    async def _get_schedule_image(self, target_date: datetime) -> Optional[ScheduleImage]:
+        """Получение расписания на дату через кэш без объединения запросов"""
+        image = await self._lookup_schedule_image(target_date)
+        if image is None:
+            return None
+        # Содержимое подгружается в память без блокировки цикла событий
+        return await self.cache.load(image)
+    
+    async def _lookup_schedule_image(self, target_date: datetime,
+                                     force: bool = False) -> Optional[ScheduleImage]:
+        """
+        Поиск записи кэша на дату с перепроверкой на сайте при необходимости
+        
+        Args:
+            target_date: Дата для поиска
+            force: Перепроверить на сайте даже свежую запись
+        """
+        date_key = target_date.strftime('%Y-%m-%d')
+        
+        try:
+            cached = await self.cache.get(date_key)
+            if cached and cached.is_fresh and not force:
+                logger.info(f"Расписание на {date_key} взято из кэша")
+                CACHE_LOOKUPS.labels("hit").inc()
+                return cached
+            
+            if not cached and not force and await self.cache.is_recent_miss(date_key):
+                logger.info(f"Расписание на {date_key} недавно не было найдено")
+                CACHE_LOOKUPS.labels("negative_hit").inc()
+                return None
+            
+            CACHE_LOOKUPS.labels("stale" if cached else "miss").inc()
+            
+            logger.info(f"Получение расписания на {target_date.strftime('%d.%m.%Y')}")
+            
+            # Ищем расписание на указанную дату
+            errors_before = self.fetch_errors
+            image_urls = await self.find_schedule_images(target_date)
+            
+            if not image_urls:
+                if cached:
+                    # Сайт недоступен или запись снята - отдаем то, что есть
+                    logger.warning(f"Не удалось перепроверить расписание на {date_key}, отдаем из кэша")
+                    return cached
+                logger.warning(f"Расписание на {target_date.strftime('%d.%m.%Y')} не найдено")
+                # При ошибке сайта "не найдено" может быть ложным - в индекс не пишем
+                if self.fetch_errors == errors_before:
+                    await self.cache.remember_miss(date_key)
+                return None
+            
+            return await self._store_site_images(date_key, cached, image_urls)
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении расписания: {e}", exc_info=True)
+            count_error("parser", e)
+            return None
+    
+    async def update_schedule_image(self, target_date: datetime,
+                                    image_urls: List[str]) -> Optional[ScheduleImage]:
+        """
+        Обновление кэша по изображениям, уже найденным на сайте (например,
+        в ленте блога), без загрузки страницы даты
+        
+        Args:
+            target_date: Дата
+            image_urls: Изображения расписания на дату (пустой список,
+                если расписания нет)
+        
+        Returns:
+            Актуальная запись кэша (без содержимого в памяти) или None
+        """
+        date_key = target_date.strftime('%Y-%m-%d')
+        
+        try:
+            cached = await self.cache.get(date_key)
+            if not image_urls:
+                if cached:
+                    # Запись могла переехать на другую дату - перепроверит страница даты
+                    return cached
+                await self.cache.remember_miss(date_key)
+                return None
+            
+            return await self._store_site_images(date_key, cached, image_urls)
+        
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении расписания на {date_key}: {e}", exc_info=True)
+            return None
+    
+    async def _store_site_images(self, date_key: str, cached: Optional[ScheduleImage],
+                                 image_urls: List[str]) -> Optional[ScheduleImage]:
+        """
+        Запись в кэш изображения, найденного на сайте
+        
+        Изображение скачивается, только если оно новое или изменилось.
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            cached: Текущая запись кэша на дату
+            image_urls: Изображения расписания на дату (первое - основное)
+        
+        Returns:
+            Актуальная запись кэша или прежняя, если скачать не удалось
+        """
+        image_url = image_urls[0]
+        
+        if cached and cached.image_url == image_url and not self.has_validators(image_url):
+            # Без валидаторов доверяем URL: изображение не скачиваем заново
+            await self.cache.touch(cached)
+            return cached
+        
+        # Условный запрос; без валидаторов - обычное потоковое скачивание
+        content_hash, path = await self.revalidate_image(image_url)
+        if content_hash and path is None and not os.path.exists(self.cache.path_for(content_hash)):
+            # 304, но файла с этим содержимым уже нет - скачиваем заново
+            content_hash, path = await self.fetch_image(image_url)
+        if content_hash is None:
+            return cached
+        
+        if cached and cached.image_url == image_url and cached.content_hash == content_hash:
+            await self.cache.touch(cached)
+            return cached
+        
+        return await self.cache.put(date_key, image_urls, content_hash)
+    
+    async def get_schedule_for_date(self, target_date: datetime) -> Optional[str]:
+        """
+        Получение расписания на конкретную дату
+        
+        Args:
+            target_date: Дата для получения расписания
+            
+        Returns:
+            Путь к сохраненному файлу или None
+        """
+        image = await self.get_schedule_image(target_date)
+        return image.path if image else None
+
+
+# Создание глобального экземпляра парсера
+parser = ScheduleParser()
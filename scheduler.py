@@ -1,180 +1,553 @@
-"""
-Модуль для фоновой проверки обновлений расписания
-"""
-
-import asyncio
-import logging
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
-
-from parser import parser
-from database import db
-
-logger = logging.getLogger(__name__)
-
-
-async def send_schedule_to_users(bot: Bot, schedule_path: str, caption: str = "📅 Новое расписание!"):
-    """
-    Отправка расписания всем подписанным пользователям
-    
-    Args:
-        bot: Экземпляр бота
-        schedule_path: Путь к файлу с расписанием
-        caption: Подпись к изображению
-    """
-    users = db.get_all_users()
-    
-    if not users:
-        logger.info("Нет подписанных пользователей для рассылки")
-        return
-    
-    logger.info(f"Начинаем рассылку расписания {len(users)} пользователям")
-    
-    success_count = 0
-    error_count = 0
-    blocked_count = 0
-    
-    # Создаем объект файла для отправки
-    photo = FSInputFile(schedule_path)
-    
-    for user_id in users:
-        try:
-            await bot.send_photo(
-                chat_id=user_id,
-                photo=photo,
-                caption=caption
-            )
-            success_count += 1
-            logger.info(f"Расписание отправлено пользователю {user_id}")
-            
-            # Небольшая задержка между отправками, чтобы не превысить лимиты Telegram
-            await asyncio.sleep(0.05)
-            
-        except TelegramForbiddenError:
-            # Пользователь заблокировал бота
-            logger.warning(f"Пользователь {user_id} заблокировал бота, удаляем из БД")
-            db.remove_user(user_id)
-            blocked_count += 1
-            
-        except TelegramBadRequest as e:
-            logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
-            error_count += 1
-            
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при отправке пользователю {user_id}: {e}")
-            error_count += 1
-    
-    logger.info(
-        f"Рассылка завершена. Успешно: {success_count}, "
-        f"Ошибок: {error_count}, Заблокировали: {blocked_count}"
-    )
-
-
-async def check_schedule_updates(bot: Bot):
-    """
-    Проверка обновлений расписания и рассылка при наличии
-    
-    Args:
-        bot: Экземпляр бота
-    """
-    try:
-        logger.info("Запуск проверки обновлений расписания")
-        
-        # Проверяем наличие обновлений
-        has_update, schedule_path = await parser.check_for_updates()
-        
-        if has_update and schedule_path:
-            logger.info(f"Найдено новое расписание: {schedule_path}")
-            
-            # Отправляем расписание всем подписчикам
-            await send_schedule_to_users(bot, schedule_path)
-        else:
-            logger.info("Обновлений расписания не обнаружено")
-            
-    except Exception as e:
-        logger.error(f"Ошибка при проверке обновлений: {e}", exc_info=True)
-
-
-async def start_schedule_checker(bot: Bot, interval: int):
-    """
-    Запуск фонового процесса проверки расписания
-    Отправляет расписание каждый день в 18:00 МСК
-    
-    Args:
-        bot: Экземпляр бота
-        interval: Интервал проверки в секундах (не используется, оставлен для совместимости)
-    """
-    from datetime import datetime, time, timedelta
-    import pytz
-    
-    logger.info("Запуск планировщика ежедневной отправки расписания в 18:00 МСК")
-    
-    # Часовой пояс Москвы
-    moscow_tz = pytz.timezone('Europe/Moscow')
-    
-    # Первая проверка сразу при запуске
-    await check_schedule_updates(bot)
-    
-    while True:
-        try:
-            # Получаем текущее время в Москве
-            now_moscow = datetime.now(moscow_tz)
-            
-            # Целевое время - 18:00 сегодня
-            target_time = now_moscow.replace(hour=18, minute=0, second=0, microsecond=0)
-            
-            # Если 18:00 уже прошло сегодня, планируем на завтра
-            if now_moscow >= target_time:
-                target_time += timedelta(days=1)
-            
-            # Вычисляем время ожидания
-            wait_seconds = (target_time - now_moscow).total_seconds()
-            
-            logger.info(f"Следующая отправка расписания: {target_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-            logger.info(f"Ожидание: {wait_seconds / 3600:.1f} часов")
-            
-            # Ждем до 18:00
-            await asyncio.sleep(wait_seconds)
-            
-            # Отправляем расписание в 18:00
-            logger.info("Время 18:00 МСК - отправка расписания")
-            await send_daily_schedule(bot)
-            
-        except asyncio.CancelledError:
-            logger.info("Планировщик остановлен")
-            break
-        except Exception as e:
-            logger.error(f"Критическая ошибка в планировщике: {e}", exc_info=True)
-            # Ждем час перед следующей попыткой
-            await asyncio.sleep(3600)
-
-
-async def send_daily_schedule(bot: Bot):
-    """
-    Отправка расписания на завтра всем подписчикам
-    
-    Args:
-        bot: Экземпляр бота
-    """
-    from datetime import datetime, timedelta
-    from parser import parser
-    
-    try:
-        logger.info("Начинаем ежедневную рассылку расписания на завтра")
-        
-        # Получаем расписание на завтра
-        tomorrow = datetime.now() + timedelta(days=1)
-        schedule_path = await parser.get_schedule_for_date(tomorrow)
-        
-        if not schedule_path:
-            logger.warning(f"Расписание на {tomorrow.strftime('%d.%m.%Y')} не найдено")
-            return
-        
-        logger.info(f"Отправка расписания на {tomorrow.strftime('%d.%m.%Y')}: {schedule_path}")
-        
-        # Отправляем всем подписчикам
-        await send_schedule_to_users(bot, schedule_path, f"📅 Расписание на {tomorrow.strftime('%d.%m.%Y')}")
-        
-    except Exception as e:
-        logger.error(f"Ошибка при ежедневной отправке расписания: {e}", exc_info=True)
+"""
+Модуль для фоновой проверки обновлений расписания
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+import pytz
+from aiogram import Bot
+
+from cache import ScheduleImage
+from config import (
+    CHECK_INTERVAL, SCHEDULE_SEND_HOUR, PREFETCH_WINDOW_MINUTES,
+    PREFETCH_MIN_INTERVAL, PREFETCH_MAX_INTERVAL, STAGING_CHAT_ID,
+    POLL_ACTIVE_INTERVAL, POLL_IDLE_INTERVAL, POLL_ACTIVE_START_HOUR, POLL_ACTIVE_END_HOUR,
+    POLL_NIGHT_START_HOUR, POLL_NIGHT_END_HOUR, POLL_JITTER,
+    PREWARM_DAYS, SCHOOL_WEEKDAYS, PREWARM_CONCURRENCY, PREWARM_INTERVAL, DATE_PICKER_DAYS,
+    SCHEDULE_CACHE_TTL
+)
+from parser import parser
+from database import db
+from jobs import broadcast_schedule, resume_broadcasts
+from media import prepare_file_id
+
+logger = logging.getLogger(__name__)
+
+# Часовой пояс Москвы
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+
+async def send_schedule_to_users(bot: Bot, schedule_path: str, caption: str = "📅 Новое расписание!",
+                                 content_hash: Optional[str] = None):
+    """
+    Отправка расписания всем подписанным пользователям
+    
+    Args:
+        bot: Экземпляр бота
+        schedule_path: Путь к файлу с расписанием
+        caption: Подпись к изображению
+        content_hash: Хэш изображения, если уже известен
+    """
+    users_count = await db.get_users_count()
+    
+    if not users_count:
+        logger.info("Нет подписанных пользователей для рассылки")
+        return
+    
+    logger.info(f"Начинаем рассылку расписания {users_count} пользователям")
+    
+    # Рассылка идет через задание в БД: после перезапуска она продолжится
+    # с контрольной точки, а не начнется заново
+    stats = await broadcast_schedule(bot, schedule_path, caption, users_count,
+                                     content_hash=content_hash)
+    if stats is None:
+        logger.error("Не удалось создать задание рассылки")
+        return
+    
+    logger.info(
+        f"Рассылка завершена за {stats.elapsed:.1f} сек. Успешно: {stats.success}, "
+        f"Ошибок: {stats.errors}, Заблокировали: {stats.blocked}"
+    )
+
+
+def moscow_today() -> datetime:
+    """Текущая дата по Москве (полночь, без часового пояса - как ждет парсер)"""
+    return datetime.combine(datetime.now(MOSCOW_TZ).date(), datetime.min.time())
+
+
+class SchedulePoller:
+    """
+    Отслеживание исправлений в уже разосланных расписаниях
+    
+    Помнит, какое изображение на какую дату получили подписчики, и
+    периодически перепроверяет расписание на сегодня и завтра. Если на
+    сайте появилась исправленная версия, подписчики получают ее. Даты,
+    на которые рассылки еще не было, не проверяются и не рассылаются -
+    поэтому перезапуск бота не вызывает внеплановой рассылки. Исключение -
+    завтрашний день после SCHEDULE_SEND_HOUR: если в момент ежедневной
+    рассылки расписания еще не было, оно рассылается, как только появится.
+    """
+    
+    def __init__(self, state_file: str = "sent_schedules.json"):
+        """
+        Args:
+            state_file: Файл с хэшами разосланных изображений по датам
+        """
+        self.state_file = state_file
+        self._sent: Dict[str, str] = self._load_state()
+        # Число неудачных проверок подряд (для экспоненциальной задержки)
+        self.errors = 0
+    
+    def _load_state(self) -> Dict[str, str]:
+        """Загрузка разосланных хэшей с диска"""
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния рассылок: {e}")
+        return {}
+    
+    def _save_state(self):
+        """Атомарное сохранение разосланных хэшей на диск"""
+        try:
+            tmp_path = self.state_file + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._sent, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния рассылок: {e}")
+    
+    def mark_sent(self, date_key: str, content_hash: str):
+        """
+        Запоминание изображения, разосланного на дату
+        
+        Args:
+            date_key: Дата в формате YYYY-MM-DD
+            content_hash: Хэш разосланного изображения
+        """
+        yesterday = (moscow_today() - timedelta(days=1)).strftime('%Y-%m-%d')
+        self._sent = {key: value for key, value in self._sent.items() if key >= yesterday}
+        self._sent[date_key] = content_hash
+        self._save_state()
+    
+    def is_sent(self, date_key: str) -> bool:
+        """Проверка, что расписание на дату уже разослано"""
+        return date_key in self._sent
+    
+    async def check(self, bot: Bot) -> bool:
+        """
+        Одна проверка расписаний на сегодня и завтра
+        
+        Args:
+            bot: Экземпляр бота
+        
+        Returns:
+            True если сайт ответил без ошибок
+        """
+        errors_before = parser.fetch_errors
+        today = moscow_today()
+        tomorrow = today + timedelta(days=1)
+        # Ежедневная рассылка уже была: расписание на завтра, которого
+        # тогда еще не было, ждет отправки
+        daily_pending = datetime.now(MOSCOW_TZ).hour >= SCHEDULE_SEND_HOUR
+        
+        for day in (today, tomorrow):
+            date_key = day.strftime('%Y-%m-%d')
+            if not self.is_sent(date_key) and not (day == tomorrow and daily_pending):
+                continue
+            
+            image = await parser.refresh_schedule_image(day)
+            if image is None:
+                continue
+            # Пока шел запрос, дату могла разослать ежедневная рассылка
+            sent_hash = self._sent.get(date_key)
+            if sent_hash is None:
+                logger.info(f"Расписание на {day.strftime('%d.%m.%Y')} опубликовано "
+                            f"после {SCHEDULE_SEND_HOUR}:00 - рассылаем")
+                self.mark_sent(date_key, image.content_hash)
+                await send_schedule_to_users(
+                    bot, image.path, f"📅 Расписание на {day.strftime('%d.%m.%Y')}",
+                    image.content_hash
+                )
+                continue
+            if image.content_hash == sent_hash:
+                continue
+            if await parser.is_same_content(sent_hash, image.content_hash):
+                # Перекодированная копия того же расписания - повторно не рассылаем
+                logger.info(f"Изображение на {day.strftime('%d.%m.%Y')} заменено без изменений расписания")
+                continue
+            
+            logger.info(f"Расписание на {day.strftime('%d.%m.%Y')} изменилось после рассылки")
+            self.mark_sent(date_key, image.content_hash)
+            await send_schedule_to_users(
+                bot, image.path, f"✏️ Изменения в расписании на {day.strftime('%d.%m.%Y')}",
+                image.content_hash
+            )
+        
+        return parser.fetch_errors == errors_before
+    
+    def next_interval(self, now: datetime, max_interval: float) -> float:
+        """
+        Интервал до следующей проверки
+        
+        Часто в часы публикации, реже днем, раз в max_interval ночью.
+        После ошибок интервал растет экспоненциально (но не больше
+        max_interval). Случайный разброс POLL_JITTER не дает проверкам
+        совпадать по времени.
+        
+        Args:
+            now: Текущее время по Москве
+            max_interval: Ночной и максимальный интервал (в секундах)
+        
+        Returns:
+            Интервал в секундах
+        """
+        hour = now.hour
+        if hour >= POLL_NIGHT_START_HOUR or hour < POLL_NIGHT_END_HOUR:
+            interval = max_interval
+        elif POLL_ACTIVE_START_HOUR <= hour < POLL_ACTIVE_END_HOUR:
+            interval = POLL_ACTIVE_INTERVAL
+        else:
+            interval = POLL_IDLE_INTERVAL
+        
+        if self.errors:
+            interval = min(max_interval, interval * 2 ** self.errors)
+        return interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+    
+    async def run(self, bot: Bot, max_interval: float = CHECK_INTERVAL):
+        """
+        Фоновая проверка исправлений
+        
+        Args:
+            bot: Экземпляр бота
+            max_interval: Ночной и максимальный интервал (в секундах)
+        """
+        while True:
+            try:
+                ok = await self.check(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при проверке обновлений: {e}", exc_info=True)
+                ok = False
+            
+            self.errors = 0 if ok else self.errors + 1
+            interval = self.next_interval(datetime.now(MOSCOW_TZ), max_interval)
+            if not ok:
+                logger.warning(f"Сайт колледжа недоступен, следующая проверка через {interval:.0f} сек")
+            await asyncio.sleep(interval)
+
+
+class ScheduleWarmer:
+    """
+    Фоновый прогрев расписаний на ближайшие учебные дни
+    
+    Периодически проверяет на сайте PREWARM_DAYS ближайших учебных дней
+    (не больше PREWARM_CONCURRENCY одновременно) и кладет найденные
+    изображения в кэш. Лента блога при этом просматривается на весь
+    период выбора даты (DATE_PICKER_DAYS): для дальних дат в индекс
+    записываются только найденные изображения, без скачивания.
+    Результаты проверок записываются в индекс расписаний, поэтому выбор
+    даты в боте отвечает из кэша и индекса, без запроса к сайту в момент
+    нажатия.
+    """
+    
+    def __init__(self, days: int = PREWARM_DAYS, concurrency: int = PREWARM_CONCURRENCY,
+                 picker_days: int = DATE_PICKER_DAYS):
+        """
+        Args:
+            days: Сколько учебных дней прогревать
+            concurrency: Сколько дат проверять одновременно
+            picker_days: На сколько дней вперед искать расписания в ленте
+        """
+        self.days = days
+        self.concurrency = concurrency
+        self.picker_days = picker_days
+    
+    def school_days(self, start: datetime) -> List[datetime]:
+        """
+        Ближайшие учебные дни начиная с указанной даты
+        
+        Args:
+            start: Первая дата (включительно)
+        
+        Returns:
+            Список из self.days дат
+        """
+        days = []
+        date = start
+        while len(days) < self.days:
+            if date.weekday() in SCHOOL_WEEKDAYS:
+                days.append(date)
+            date += timedelta(days=1)
+        return days
+    
+    async def is_published(self, target_date: datetime) -> Optional[bool]:
+        """
+        Опубликовано ли расписание на дату по данным индекса расписаний
+        
+        Args:
+            target_date: Дата
+        
+        Returns:
+            True, если расписание найдено не дольше SCHEDULE_CACHE_TTL
+            секунд назад; False, если его не было при проверке не дольше
+            SCHEDULE_CACHE_MISS_TTL секунд назад (как у отрицательного кэша
+            парсера); иначе None
+        """
+        key = target_date.strftime('%Y-%m-%d')
+        published = await parser.cache.availability(key, SCHEDULE_CACHE_TTL)
+        if published is False and not await parser.cache.is_recent_miss(key):
+            # Расписание могли опубликовать сразу после проверки
+            return None
+        return published
+    
+    async def published_dates(self) -> List[str]:
+        """Ближайшие учебные даты (YYYY-MM-DD), на которые расписание уже опубликовано"""
+        days = self.school_days(moscow_today())
+        return await db.get_published_dates(days[0].strftime('%Y-%m-%d'), days[-1].strftime('%Y-%m-%d'))
+    
+    async def _warm_date(self, semaphore: asyncio.Semaphore, target_date: datetime,
+                         discovered: Optional[Dict[str, List[str]]]) -> bool:
+        """Проверка одной даты и загрузка изображения в память"""
+        async with semaphore:
+            if discovered is not None:
+                image_urls = discovered.get(target_date.strftime('%Y-%m-%d'), [])
+                image = await parser.update_schedule_image(target_date, image_urls)
+            else:
+                image = await parser.refresh_schedule_image(target_date)
+            if image is not None:
+                image = await parser.cache.load(image)
+        return image is not None
+    
+    async def warm(self) -> int:
+        """
+        Один проход прогрева
+        
+        Сначала все даты периода выбора ищутся одним просмотром ленты
+        блога; страницы отдельных дат загружаются, только если ленту
+        просмотреть не удалось. Изображения скачиваются только для
+        ближайших учебных дней.
+        
+        Returns:
+            Число ближайших учебных дней, на которые расписание опубликовано
+        """
+        today = moscow_today()
+        days = self.school_days(today)
+        last_date = max(days[-1], today + timedelta(days=self.picker_days - 1))
+        discovered = await parser.discover_schedules(days[0], last_date)
+        if discovered is not None:
+            await self._index_discovered(discovered, today, last_date, set(days))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._warm_date(semaphore, date, discovered) for date in days),
+            return_exceptions=True
+        )
+        
+        for date, result in zip(days, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка прогрева расписания на {date.strftime('%d.%m.%Y')}: {result}")
+        
+        found = sum(1 for result in results if result is True)
+        logger.info(f"Прогрев расписаний: опубликовано на {found} из {len(days)} учебных дней")
+        return found
+    
+    async def _index_discovered(self, discovered: Dict[str, List[str]], first_date: datetime,
+                                last_date: datetime, warmed: Set[datetime]):
+        """
+        Запись найденного в ленте в индекс для дат, которые не прогреваются
+        
+        Args:
+            discovered: Результат просмотра ленты блога
+            first_date: Первая дата (включительно)
+            last_date: Последняя дата (включительно)
+            warmed: Даты, которые проверяются прогревом
+        """
+        date = first_date
+        while date <= last_date:
+            date_key = date.strftime('%Y-%m-%d')
+            if date not in warmed and (date_key in discovered or date.weekday() in SCHOOL_WEEKDAYS):
+                await parser.cache.remember_discovered(date_key, discovered.get(date_key, []))
+            date += timedelta(days=1)
+    
+    async def run(self, interval: float = PREWARM_INTERVAL):
+        """
+        Фоновый прогрев каждые interval секунд
+        
+        Args:
+            interval: Интервал между проходами (в секундах)
+        """
+        while True:
+            try:
+                await self.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка прогрева расписаний: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+
+async def start_schedule_checker(bot: Bot, interval: int):
+    """
+    Запуск фонового процесса проверки расписания
+    Отправляет расписание каждый день в SCHEDULE_SEND_HOUR:00 МСК
+    
+    За PREFETCH_WINDOW_MINUTES до рассылки начинается предзагрузка:
+    расписание ищется заранее, скачивается и загружается в Telegram,
+    так что в момент рассылки остается только разослать его по file_id.
+    
+    Параллельно работают проверка исправлений (SchedulePoller) и прогрев
+    расписаний на ближайшие дни (ScheduleWarmer).
+    
+    Args:
+        bot: Экземпляр бота
+        interval: Ночной и максимальный интервал проверки исправлений (в секундах)
+    """
+    logger.info(f"Запуск планировщика ежедневной отправки расписания в {SCHEDULE_SEND_HOUR}:00 МСК")
+    
+    # Сначала доводим до конца рассылки, прерванные перезапуском
+    try:
+        await resume_broadcasts(bot)
+    except Exception as e:
+        logger.error(f"Ошибка при возобновлении рассылок: {e}", exc_info=True)
+    
+    # Проверка исправлений в уже разосланных расписаниях
+    checker = asyncio.create_task(poller.run(bot, interval))
+    # Прогрев расписаний на ближайшие дни для выбора даты
+    prewarm = asyncio.create_task(warmer.run())
+    
+    while True:
+        try:
+            # Получаем текущее время в Москве
+            now_moscow = datetime.now(MOSCOW_TZ)
+            
+            # Целевое время - время рассылки сегодня
+            target_time = now_moscow.replace(hour=SCHEDULE_SEND_HOUR, minute=0, second=0, microsecond=0)
+            
+            # Если время рассылки уже прошло сегодня, планируем на завтра
+            if now_moscow >= target_time:
+                target_time += timedelta(days=1)
+            
+            logger.info(f"Следующая отправка расписания: {target_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            
+            # Ждем начала окна предзагрузки
+            prefetch_time = target_time - timedelta(minutes=PREFETCH_WINDOW_MINUTES)
+            wait_seconds = (prefetch_time - now_moscow).total_seconds()
+            if wait_seconds > 0:
+                logger.info(f"Ожидание начала предзагрузки: {wait_seconds / 3600:.1f} часов")
+                await asyncio.sleep(wait_seconds)
+            
+            # Предзагрузка идет до самого времени рассылки
+            staged = await prefetch_schedule(bot, target_time)
+            
+            logger.info(f"Время {SCHEDULE_SEND_HOUR}:00 МСК - отправка расписания")
+            await send_daily_schedule(bot, staged)
+        
+        except asyncio.CancelledError:
+            logger.info("Планировщик остановлен")
+            checker.cancel()
+            prewarm.cancel()
+            break
+        except Exception as e:
+            logger.error(f"Критическая ошибка в планировщике: {e}", exc_info=True)
+            # Ждем час перед следующей попыткой
+            await asyncio.sleep(3600)
+
+
+def prefetch_interval(seconds_left: float, found: bool) -> float:
+    """
+    Интервал до следующей проверки сайта во время предзагрузки
+    
+    Пока расписания нет, проверки учащаются по мере приближения рассылки:
+    десятая часть оставшегося времени в пределах PREFETCH_MIN_INTERVAL -
+    PREFETCH_MAX_INTERVAL. Найденное расписание перепроверяется редко,
+    только на случай исправлений.
+    
+    Args:
+        seconds_left: Сколько секунд осталось до рассылки
+        found: Найдено ли уже расписание
+    
+    Returns:
+        Интервал в секундах
+    """
+    if found:
+        return PREFETCH_MAX_INTERVAL
+    return min(PREFETCH_MAX_INTERVAL, max(PREFETCH_MIN_INTERVAL, seconds_left / 10))
+
+
+async def prefetch_schedule(bot: Bot, target_time: datetime) -> Optional[ScheduleImage]:
+    """
+    Заблаговременный поиск и подготовка расписания на следующий день
+    
+    До target_time сайт опрашивается с адаптивным интервалом. Найденное
+    изображение скачивается в кэш и (если задан STAGING_CHAT_ID)
+    загружается в Telegram, чтобы рассылка сразу шла по file_id.
+    
+    Args:
+        bot: Экземпляр бота
+        target_time: Время рассылки (с часовым поясом)
+    
+    Returns:
+        Подготовленное изображение или None, если расписание не появилось
+    """
+    tomorrow = datetime.combine(target_time.date() + timedelta(days=1), datetime.min.time())
+    logger.info(f"Предзагрузка расписания на {tomorrow.strftime('%d.%m.%Y')}")
+    
+    staged = None
+    while True:
+        try:
+            image = await parser.get_schedule_image(tomorrow)
+            if image and (staged is None or image.content_hash != staged.content_hash):
+                logger.info(f"Расписание на {tomorrow.strftime('%d.%m.%Y')} подготовлено: {image.path}")
+                if STAGING_CHAT_ID is not None:
+                    await prepare_file_id(bot, STAGING_CHAT_ID, image.path, image.content_hash, image.data)
+            if image:
+                staged = image
+        except Exception as e:
+            logger.error(f"Ошибка предзагрузки расписания: {e}", exc_info=True)
+        
+        seconds_left = (target_time - datetime.now(MOSCOW_TZ)).total_seconds()
+        if seconds_left <= 0:
+            return staged
+        await asyncio.sleep(min(prefetch_interval(seconds_left, staged is not None), seconds_left))
+
+
+async def send_daily_schedule(bot: Bot, staged: Optional[ScheduleImage] = None):
+    """
+    Отправка расписания на завтра всем подписчикам
+    
+    Args:
+        bot: Экземпляр бота
+        staged: Расписание, подготовленное предзагрузкой (если нет - ищется сейчас)
+    """
+    try:
+        logger.info("Начинаем ежедневную рассылку расписания на завтра")
+        
+        # Получаем расписание на завтра
+        tomorrow = datetime.now(MOSCOW_TZ).replace(tzinfo=None) + timedelta(days=1)
+        schedule = staged or await parser.get_schedule_image(tomorrow)
+        
+        if not schedule:
+            logger.warning(f"Расписание на {tomorrow.strftime('%d.%m.%Y')} не найдено, "
+                           f"оно будет разослано, как только появится")
+            return
+        if poller.is_sent(tomorrow.strftime('%Y-%m-%d')):
+            # Пока искали расписание, его уже разослала проверка исправлений
+            logger.info(f"Расписание на {tomorrow.strftime('%d.%m.%Y')} уже разослано")
+            return
+        
+        logger.info(f"Отправка расписания на {tomorrow.strftime('%d.%m.%Y')}: {schedule.path}")
+        
+        # Запоминаем до начала рассылки: если ее прервет перезапуск, задание
+        # продолжится само, а не повторится как "исправление"
+        poller.mark_sent(tomorrow.strftime('%Y-%m-%d'), schedule.content_hash)
+        
+        # Отправляем всем подписчикам (изображение и file_id уже подготовлены)
+        await send_schedule_to_users(bot, schedule.path, f"📅 Расписание на {tomorrow.strftime('%d.%m.%Y')}",
+                                     schedule.content_hash)
+    
+    except Exception as e:
+        logger.error(f"Ошибка при ежедневной отправке расписания: {e}", exc_info=True)
+
+
+# Создание глобального экземпляра проверки исправлений
+poller = SchedulePoller()
+
+# Создание глобального экземпляра прогрева расписаний
+warmer = ScheduleWarmer()
@@ -0,0 +1,119 @@
+"""
+Скрипт для локальной проверки режима webhook
+Отправляет сохраненные обновления Telegram (JSON файлы) на запущенный
+сервер webhook с правильным секретным токеном
+    
+    BOT_MODE=webhook python bot.py                    # в одном терминале
+    python send_updates.py                            # обновления из sample_updates/
+    python send_updates.py my_update.json --repeat 100
+"""
+
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from typing import List
+import aiohttp
+
+from config import WEBAPP_PORT, WEBHOOK_PATH
+from webhook import SECRET_HEADER, webhook_secret
+
+# Папка с примерами обновлений
+SAMPLES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_updates")
+
+# Адрес локального сервера webhook
+WEBHOOK_URL = f"http://127.0.0.1:{WEBAPP_PORT}{WEBHOOK_PATH}"
+
+
+def load_updates(paths: List[str]) -> List[dict]:
+    """
+    Загрузка обновлений из файлов и папок
+    
+    Файл может содержать одно обновление или список обновлений.
+    
+    Args:
+        paths: Пути к JSON файлам или папкам с ними
+    
+    Returns:
+        Список обновлений
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+    
+    updates = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+
+async def send_updates(updates: List[dict], secret: str) -> bool:
+    """
+    Отправка обновлений на сервер webhook одновременно
+    
+    Args:
+        updates: Обновления
+        secret: Секретный токен webhook
+    
+    Returns:
+        True если сервер принял все обновления
+    """
+    headers = {SECRET_HEADER: secret}
+    
+    async with aiohttp.ClientSession() as session:
+        async def post(update: dict) -> int:
+            async with session.post(WEBHOOK_URL, json=update, headers=headers) as response:
+                return response.status
+        
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(post(update) for update in updates), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+    
+    accepted = sum(1 for status in statuses if status == 200)
+    for update, status in zip(updates, statuses):
+        if status != 200:
+            print(f"❌ Обновление {update.get('update_id')}: {status}")
+    
+    print(f"Принято обновлений: {accepted} из {len(updates)} за {elapsed:.2f} сек")
+    return accepted == len(updates)
+
+
+async def main() -> int:
+    """Главная функция"""
+    args = sys.argv[1:]
+    
+    repeat = 1
+    if "--repeat" in args:
+        index = args.index("--repeat")
+        repeat = int(args[index + 1])
+        del args[index:index + 2]
+    
+    secret = webhook_secret()
+    if "--bad-secret" in args:
+        # Проверка, что сервер отклоняет чужие запросы
+        args.remove("--bad-secret")
+        secret = "wrong"
+    
+    updates = load_updates(args or [SAMPLES_FOLDER]) * repeat
+    if not updates:
+        print("❌ Нет обновлений для отправки")
+        return 1
+    
+    print(f"Отправка {len(updates)} обновлений на {WEBHOOK_URL}")
+    try:
+        ok = await send_updates(updates, secret)
+    except aiohttp.ClientError as e:
+        print(f"❌ Сервер недоступен: {e}")
+        return 1
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
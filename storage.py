@@ -0,0 +1,353 @@
+"""
+Модуль хранилища изображений расписания
+Файлы называются по хэшу содержимого, поэтому одинаковые изображения
+хранятся один раз. Индекс метаданных позволяет удалять старые файлы
+по возрасту и по общему размеру хранилища
+
+Операции с диском (перенос файлов, запись индекса, вытеснение)
+выполняются в пуле потоков, чтобы не останавливать цикл событий
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+from config import (
+    SCHEDULE_FOLDER, IMAGE_STORE_MAX_BYTES, IMAGE_STORE_MAX_AGE_DAYS,
+    IMAGE_STORE_EVICT_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+# Как часто сохранять индекс, если менялось только время доступа (в секундах)
+INDEX_SAVE_INTERVAL = 60
+
+# Незавершенные загрузки старше этого времени считаются брошенными (в секундах)
+STALE_PART_AGE = 3600
+
+
+class ImageStore:
+    """Хранилище изображений с дедупликацией по хэшу и вытеснением"""
+    
+    def __init__(self, folder: str = SCHEDULE_FOLDER,
+                 max_bytes: int = IMAGE_STORE_MAX_BYTES,
+                 max_age_days: int = IMAGE_STORE_MAX_AGE_DAYS):
+        """
+        Args:
+            folder: Папка хранилища
+            max_bytes: Максимальный суммарный размер изображений
+            max_age_days: Сколько дней хранить изображение после последнего обращения
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.index_file = os.path.join(folder, "store_index.json")
+        self._index: Dict[str, dict] = self._load_index()
+        self._saved_at = time.time()
+        self._dirty = False
+        self._evicted_at = 0.0
+        # Создаются при первом использовании внутри цикла событий
+        self._save_lock: Optional[asyncio.Lock] = None
+        self._files_lock: Optional[asyncio.Lock] = None
+    
+    def _load_index(self) -> Dict[str, dict]:
+        """Загрузка индекса метаданных с диска"""
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса хранилища: {e}")
+        return {}
+    
+    def _write_index(self, snapshot: Dict[str, dict]) -> bool:
+        """Атомарная запись копии индекса на диск (выполняется в пуле потоков)"""
+        try:
+            tmp_path = self.index_file + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.index_file)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения индекса хранилища: {e}")
+            return False
+    
+    async def save(self):
+        """
+        Сохранение индекса, если он менялся
+        
+        В цикле событий снимается только копия индекса, сериализация и
+        запись идут в пуле потоков. Одновременные сохранения выполняются
+        по очереди, поэтому более старая копия не перезапишет новую.
+        """
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            snapshot = {h: dict(entry, dates=list(entry['dates'])) for h, entry in self._index.items()}
+            self._dirty = False
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self._write_index, snapshot):
+                self._saved_at = time.time()
+            else:
+                self._dirty = True
+    
+    def _files(self) -> asyncio.Lock:
+        """Блокировка операций с файлами (перенос и вытеснение)"""
+        if self._files_lock is None:
+            self._files_lock = asyncio.Lock()
+        return self._files_lock
+    
+    @property
+    def total_size(self) -> int:
+        """Суммарный размер изображений в хранилище (в байтах)"""
+        return sum(entry['size'] for entry in self._index.values())
+    
+    def path_for(self, content_hash: str) -> str:
+        """
+        Путь к файлу изображения по хэшу содержимого
+        
+        Args:
+            content_hash: Хэш содержимого
+        
+        Returns:
+            Путь к файлу
+        """
+        return os.path.join(self.folder, f"{content_hash}.jpg")
+    
+    def staging_path(self) -> str:
+        """
+        Временный путь для скачивания нового изображения
+        
+        Файл лежит в папке хранилища, поэтому commit() переносит его
+        атомарным переименованием.
+        
+        Returns:
+            Путь к временному файлу
+        """
+        return os.path.join(self.folder, f"incoming_{uuid.uuid4().hex}.part")
+    
+    def contains(self, content_hash: str) -> bool:
+        """
+        Проверка наличия изображения в хранилище
+        
+        Args:
+            content_hash: Хэш содержимого
+        
+        Returns:
+            True если файл есть на диске
+        """
+        return os.path.exists(self.path_for(content_hash))
+    
+    async def commit(self, staging_path: str, content_hash: str,
+                     source_url: Optional[str] = None, date_key: Optional[str] = None) -> str:
+        """
+        Перенос скачанного файла в хранилище
+        
+        Если изображение с таким хэшем уже есть, временный файл удаляется.
+        Вытеснение в это время не выполняется, поэтому оно не удалит
+        файл, который только что оказался снова нужен.
+        
+        Args:
+            staging_path: Путь, полученный из staging_path()
+            content_hash: Хэш содержимого
+            source_url: URL, с которого скачано изображение
+            date_key: Дата расписания в формате YYYY-MM-DD
+        
+        Returns:
+            Путь к файлу в хранилище
+        """
+        path = self.path_for(content_hash)
+        loop = asyncio.get_running_loop()
+        async with self._files():
+            size = await loop.run_in_executor(None, self._move, staging_path, path)
+            self._record(content_hash, size, source_url, date_key)
+        await self.save()
+        return path
+    
+    @staticmethod
+    def _move(staging_path: str, path: str) -> int:
+        """Перенос временного файла на место (выполняется в пуле потоков)"""
+        if os.path.exists(path):
+            os.remove(staging_path)
+        else:
+            os.replace(staging_path, path)
+            logger.info(f"Изображение сохранено: {path}")
+        return os.path.getsize(path)
+    
+    async def record(self, content_hash: str, source_url: Optional[str] = None,
+                     date_key: Optional[str] = None):
+        """
+        Обновление метаданных уже сохраненного изображения
+        
+        Args:
+            content_hash: Хэш содержимого
+            source_url: URL изображения
+            date_key: Дата расписания в формате YYYY-MM-DD
+        """
+        size = None
+        if content_hash not in self._index:
+            loop = asyncio.get_running_loop()
+            size = await loop.run_in_executor(None, self._file_size, content_hash)
+            if size is None:
+                return
+        self._record(content_hash, size, source_url, date_key)
+        await self.save()
+    
+    def _file_size(self, content_hash: str) -> Optional[int]:
+        """Размер файла изображения или None, если файла нет"""
+        try:
+            return os.path.getsize(self.path_for(content_hash))
+        except OSError:
+            return None
+    
+    def _record(self, content_hash: str, size: Optional[int],
+                source_url: Optional[str], date_key: Optional[str]):
+        """Создание или обновление записи индекса (без обращения к диску)"""
+        now = time.time()
+        entry = self._index.get(content_hash)
+        if entry is None:
+            entry = {
+                'size': size or 0,
+                'created_at': now,
+                'source_url': source_url,
+                'dates': []
+            }
+            self._index[content_hash] = entry
+        if source_url:
+            entry['source_url'] = source_url
+        if date_key and date_key not in entry['dates']:
+            entry['dates'].append(date_key)
+        entry['last_access'] = now
+        self._dirty = True
+    
+    async def touch(self, content_hash: str):
+        """
+        Отметка об обращении к изображению
+        
+        Индекс сохраняется не чаще раза в INDEX_SAVE_INTERVAL секунд.
+        
+        Args:
+            content_hash: Хэш содержимого
+        """
+        entry = self._index.get(content_hash)
+        if entry is None:
+            return
+        entry['last_access'] = time.time()
+        self._dirty = True
+        if time.time() - self._saved_at > INDEX_SAVE_INTERVAL:
+            await self.save()
+    
+    @property
+    def eviction_due(self) -> bool:
+        """
+        Пора ли запускать вытеснение
+        
+        Вытеснение выполняется не чаще раза в IMAGE_STORE_EVICT_INTERVAL
+        секунд, если хранилище не превысило лимит размера.
+        """
+        return (time.time() - self._evicted_at > IMAGE_STORE_EVICT_INTERVAL
+                or self.total_size > self.max_bytes)
+    
+    async def evict(self, protected: Iterable[str] = ()) -> int:
+        """
+        Удаление изображений по возрасту и по лимиту размера
+        
+        Сначала удаляются изображения, к которым не обращались дольше
+        max_age_days, затем самые давно использованные, пока размер
+        хранилища не уложится в max_bytes. Также удаляются брошенные
+        временные файлы и старые файлы schedule_*.jpg, которые писались
+        до появления хранилища.
+        
+        Args:
+            protected: Хэши, которые удалять нельзя (актуальные расписания)
+        
+        Returns:
+            Количество удаленных файлов
+        """
+        protected = set(protected)
+        loop = asyncio.get_running_loop()
+        
+        async with self._files():
+            now = time.time()
+            self._evicted_at = now
+            
+            # Записи без файла (файл удален вручную)
+            missing = await loop.run_in_executor(None, self._missing, list(self._index))
+            for content_hash in missing:
+                self._index.pop(content_hash, None)
+                self._dirty = True
+            
+            # Выбор файлов для удаления - только по индексу в памяти
+            victims = []
+            by_access = sorted(self._index.items(), key=lambda item: item[1]['last_access'])
+            total = self.total_size
+            for content_hash, entry in by_access:
+                if content_hash in protected:
+                    continue
+                expired = now - entry['last_access'] > self.max_age
+                if not expired and total <= self.max_bytes:
+                    break
+                victims.append(content_hash)
+                total -= entry['size']
+            
+            deleted = await loop.run_in_executor(None, self._remove_files, victims)
+            for content_hash in victims:
+                if content_hash in deleted:
+                    self._index.pop(content_hash, None)
+                    self._dirty = True
+                elif content_hash in self._index:
+                    total += self._index[content_hash]['size']
+            
+            removed = len(deleted) + await loop.run_in_executor(None, self._remove_orphans, now)
+        
+        await self.save()
+        if removed:
+            logger.info(f"Из хранилища удалено файлов: {removed}, размер: {total} байт")
+        return removed
+    
+    def _missing(self, hashes: List[str]) -> List[str]:
+        """Хэши, для которых нет файла (выполняется в пуле потоков)"""
+        return [content_hash for content_hash in hashes if not self.contains(content_hash)]
+    
+    def _remove_files(self, hashes: List[str]) -> Set[str]:
+        """
+        Удаление файлов изображений (выполняется в пуле потоков)
+        
+        Returns:
+            Хэши, файлов которых больше нет
+        """
+        deleted = set()
+        for content_hash in hashes:
+            try:
+                os.remove(self.path_for(content_hash))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Ошибка удаления изображения {content_hash}: {e}")
+                continue
+            deleted.add(content_hash)
+        return deleted
+    
+    def _remove_orphans(self, now: float) -> int:
+        """Удаление брошенных временных файлов и старых файлов без индекса (в пуле потоков)"""
+        removed = 0
+        candidates = [
+            (path, STALE_PART_AGE) for path in glob.glob(os.path.join(self.folder, "*.part"))
+        ] + [
+            (path, self.max_age) for path in glob.glob(os.path.join(self.folder, "schedule_*.jpg"))
+        ]
+        for path, max_age in candidates:
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Ошибка удаления файла {path}: {e}")
+        return removed
@@ -0,0 +1,75 @@
+"""
+Проверка движка рассылки без Telegram
+Запускает Broadcaster с настройками по умолчанию на поддельном боте:
+рассылка должна дойти до всех получателей и завершиться, а не зависнуть
+    
+    python test_broadcaster.py
+"""
+
+import asyncio
+import logging
+import sys
+from types import SimpleNamespace
+
+from broadcast import Broadcaster, STATUS_SENT
+
+# Сколько секунд может идти рассылка, прежде чем она считается зависшей
+TIMEOUT = 30
+
+# Получатели тестовой рассылки
+USER_IDS = [101, 102, 103]
+
+
+class FakeBot:
+    """Бот, который запоминает отправки вместо обращения к Telegram"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def send_photo(self, chat_id: int, photo, caption: str):
+        self.sent.append(chat_id)
+        # Сообщение без фото: file_id не сохраняется в БД
+        return SimpleNamespace(photo=None)
+
+
+class Journal:
+    """Журнал итогов отправки в памяти"""
+    
+    def __init__(self):
+        self.statuses = {}
+    
+    async def record(self, user_id: int, status: str):
+        self.statuses[user_id] = status
+
+
+async def run_broadcast() -> tuple:
+    """Рассылка поддельному боту с настройками Broadcaster по умолчанию"""
+    async def batches():
+        yield USER_IDS
+    
+    bot = FakeBot()
+    journal = Journal()
+    stats = await asyncio.wait_for(
+        Broadcaster(bot).run(batches(), "schedule.jpg", "📅 Тест",
+                             content_hash="broadcaster-smoke-test", journal=journal),
+        TIMEOUT
+    )
+    return bot, journal, stats
+
+
+def test_broadcaster_defaults():
+    """Рассылка с настройками по умолчанию доходит до всех получателей"""
+    bot, journal, stats = asyncio.run(run_broadcast())
+    assert sorted(bot.sent) == USER_IDS, bot.sent
+    assert stats.success == len(USER_IDS), stats.success
+    assert journal.statuses == {user_id: STATUS_SENT for user_id in USER_IDS}, journal.statuses
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        test_broadcaster_defaults()
+    except (AssertionError, asyncio.TimeoutError) as e:
+        print(f"❌ Рассылка не прошла: {e!r}")
+        sys.exit(1)
+    print("✅ Рассылка с настройками по умолчанию прошла")
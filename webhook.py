@@ -0,0 +1,202 @@
+"""
+Модуль получения обновлений через webhook
+Встроенный aiohttp сервер принимает обновления от Telegram, проверяет
+секретный токен и ставит их в очередь, которую разбирают несколько
+обработчиков. Telegram получает ответ сразу после постановки в очередь
+"""
+
+import asyncio
+import hashlib
+import logging
+import secrets
+import signal
+from typing import Any, Dict, List, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+from config import (
+    BOT_TOKEN, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DRAIN_TIMEOUT
+)
+from metrics import WEBHOOK_QUEUE_DEPTH, WEBHOOK_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает секретный токен
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_secret() -> str:
+    """
+    Секретный токен webhook
+    
+    Если WEBHOOK_SECRET не задан, токен выводится из токена бота: так он
+    не меняется между перезапусками.
+    
+    Returns:
+        Секретный токен
+    """
+    return WEBHOOK_SECRET or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+
+
+class WebhookServer:
+    """Прием обновлений по HTTP и обработка их пулом обработчиков"""
+    
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: Optional[str] = None,
+                 workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        """
+        Args:
+            dp: Диспетчер aiogram
+            bot: Экземпляр бота
+            secret: Секретный токен (по умолчанию webhook_secret())
+            workers: Сколько обновлений обрабатывать одновременно
+            queue_size: Размер очереди принятых обновлений
+        """
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret if secret is not None else webhook_secret()
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        
+        self.app = web.Application()
+        self.app.router.add_post(WEBHOOK_PATH, self.handle)
+        self.app.router.add_get("/health", self.health)
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Прием одного обновления от Telegram
+        
+        Args:
+            request: HTTP запрос
+        
+        Returns:
+            401 при неверном секретном токене, 400 при некорректном теле,
+            иначе 200 после постановки обновления в очередь
+        """
+        received = request.headers.get(SECRET_HEADER, "").encode()
+        if not secrets.compare_digest(received, self.secret.encode()):
+            logger.warning(f"Отклонен запрос к webhook с неверным токеном от {request.remote}")
+            WEBHOOK_REQUESTS.labels("unauthorized").inc()
+            return web.Response(status=401, text="Unauthorized")
+        
+        try:
+            update = await request.json()
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            WEBHOOK_REQUESTS.labels("bad_request").inc()
+            return web.Response(status=400, text="Bad Request")
+        
+        # При заполненной очереди ответ задерживается, и Telegram
+        # присылает следующие обновления медленнее
+        await self.queue.put(update)
+        WEBHOOK_REQUESTS.labels("accepted").inc()
+        return web.json_response({})
+    
+    async def health(self, request: web.Request) -> web.Response:
+        """Проверка работоспособности для хостинга"""
+        return web.Response(text="OK")
+    
+    async def _worker(self):
+        """Обработчик очереди обновлений"""
+        while True:
+            update = await self.queue.get()
+            try:
+                await self._process(update)
+            finally:
+                self.queue.task_done()
+    
+    async def _process(self, update: Dict[str, Any]):
+        """
+        Передача обновления диспетчеру
+        
+        Args:
+            update: Обновление в том виде, в каком его прислал Telegram
+        """
+        try:
+            result = await self.dp.feed_raw_update(self.bot, update)
+            if isinstance(result, TelegramMethod):
+                await self.dp.silent_call_request(self.bot, result)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}", exc_info=True)
+    
+    def start(self):
+        """Запуск обработчиков очереди"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        WEBHOOK_QUEUE_DEPTH.set_function(self.queue.qsize)
+    
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        """
+        Остановка обработчиков после разбора очереди
+        
+        Args:
+            timeout: Сколько секунд ждать обработки уже принятых обновлений
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано обновлений при остановке: {self.queue.qsize()}")
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        WEBHOOK_QUEUE_DEPTH.set_function(None)
+
+
+async def wait_for_shutdown():
+    """Ожидание сигнала остановки (SIGINT или SIGTERM от хостинга)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # На Windows обработчики сигналов недоступны,
+            # остановка по Ctrl+C идет через KeyboardInterrupt
+            pass
+    await stop.wait()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """
+    Работа бота в режиме webhook до сигнала остановки
+    
+    Если задан WEBHOOK_BASE_URL, webhook регистрируется в Telegram. При
+    остановке webhook не удаляется: Telegram копит обновления, пока бот
+    перезапускается.
+    
+    Args:
+        dp: Диспетчер aiogram
+        bot: Экземпляр бота
+    """
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    server.start()
+    
+    try:
+        site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+        await site.start()
+        logger.info(f"Сервер webhook запущен на {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}, "
+                    f"обработчиков: {server.workers}")
+        
+        if WEBHOOK_BASE_URL:
+            url = WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH
+            await bot.set_webhook(
+                url,
+                secret_token=server.secret,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"Webhook зарегистрирован: {url}")
+        else:
+            logger.warning("WEBHOOK_BASE_URL не задан, webhook в Telegram не зарегистрирован")
+        
+        await wait_for_shutdown()
+        logger.info("Остановка сервера webhook")
+    finally:
+        # Сначала перестаем принимать запросы, затем дорабатываем очередь
+        await runner.cleanup()
+        await server.stop()